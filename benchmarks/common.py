@@ -0,0 +1,100 @@
+"""Helpers shared by the benchmarks: an offline bot, percentiles, baselines"""
+import os
+import sys
+import json
+import asyncio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import irc3  # noqa: E402
+
+from cadavre import replay  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+# no flood control, no pauses: only the code is measured
+BOT_CONFIG = dict(
+    nick='bench', username='bench', cmd='!',
+    includes=['cadavre.bot', 'cadavre.admin'],
+    flood_burst=1000, flood_rate=10 ** 6, flood_rate_delay=1,
+    level=1000,
+)
+BOT_CONFIG['irc3.plugins.command'] = {'cmd': '!',
+                                      'guard': 'cadavre.guard.policy'}
+BOT_CONFIG['cadavre.guard.masks'] = {'*': 'help,view,play'}
+BOT_CONFIG['cadavre.bot'] = {'grace_period': 0, 'cooldown': 0,
+                             'fill_timeout': 30}
+
+
+class Transport(replay.Transport):
+    """Only counts the lines, a long run would fill the memory"""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, data):
+        self.lines += data.count(b'\r\n')
+
+
+def offline_bot(channels=('#bench',)):
+    """A bot that is connected to nothing, with channels joined"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = irc3.IrcBot(loop=loop, testing=True, autojoins=list(channels),
+                      **BOT_CONFIG)
+    replay.offline(bot, Transport())
+    bot.notify('connection_made')
+    for channel in channels:
+        bot.dispatch(f':bench!b@h JOIN {channel}')
+        bot.dispatch(f':srv 366 bench {channel} :End of /NAMES list.')
+    run_once(loop)
+    return bot, loop
+
+
+def run_once(loop):
+    """Run what's ready on the loop"""
+    loop.call_soon(loop.stop)
+    loop.run_forever()
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def summarize(samples, count, elapsed):
+    """Throughput and latency percentiles, in operations per second and
+    microseconds"""
+    return {
+        'per_sec': round(count / elapsed, 1),
+        'p50_us': round(percentile(samples, .5) * 1e6, 2),
+        'p99_us': round(percentile(samples, .99) * 1e6, 2),
+    }
+
+
+def load_baseline():
+    try:
+        with open(BASELINE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def report(results, save=False):
+    """Print results next to the baseline, saving them as the new one"""
+    baseline = load_baseline()
+    for name, metrics in results.items():
+        print(name)
+        for metric, value in metrics.items():
+            line = f'    {metric:<14} {value:>12}'
+            old = baseline.get(name, {}).get(metric)
+            if old:
+                line += f'  ({(value - old) / old:+.1%} from {old})'
+            print(line)
+    if save:
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,148 @@
+"""Load benchmark: the bot against a stand-in IRC server.
+
+    python benchmarks/load.py [--channels N] [--players M] [--seconds S]
+                              [--think T] [--save]
+
+The server runs in the same process and plays M players spread over N
+channels: they all !join, then answer each prompt the bot sends them after
+a random delay of up to T seconds. The bot runs with the real plugins,
+without archive, checkpoint, flood control nor pauses between games.
+
+Reported are the games played per second, the lines exchanged per second,
+and the latency between a player sending its fragment and the bot counting
+it on the channel, next to the ones of the baseline that --save stores, as
+micro.py does.
+"""
+import re
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+from common import BOT_CONFIG, summarize, report
+
+import irc3
+
+COUNTED_RE = re.compile(r"(\S+) m'a donné son fragment")
+SENTENCE = '\N{WHITE RIGHT-POINTING TRIANGLE} '
+
+
+class Server:
+    """Just enough of an IRC server for one bot and simulated players"""
+
+    def __init__(self, loop, channels, players, think):
+        self.loop = loop
+        self.think = think
+        self.members = {channel: [] for channel in channels}
+        for i in range(players):
+            self.members[channels[i % len(channels)]].append(f'p{i}')
+        self.writer = None
+        self.nick = None
+        self.lines = 0
+        self.games = 0
+        self.sent = {}
+        self.latencies = []
+
+    def send(self, line):
+        self.lines += 1
+        self.writer.write(line.encode() + b'\r\n')
+
+    def player(self, nick, target, text):
+        self.send(f':{nick}!u@bench PRIVMSG {target} :{text}')
+
+    async def handle(self, reader, writer):
+        self.writer = writer
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            self.lines += 1
+            self.received(line.decode().rstrip('\r\n'))
+
+    def received(self, line):
+        command, _, rest = line.partition(' ')
+        if command == 'NICK':
+            self.nick = rest
+            self.send(f':srv 001 {self.nick} :Welcome')
+            self.send(f':srv 005 {self.nick} MODES=6 TARGMAX=PRIVMSG:4 '
+                      ':are supported by this server')
+            self.send(f':srv 376 {self.nick} :End of /MOTD command.')
+        elif command == 'PING':
+            self.send(f':srv PONG srv {rest}')
+        elif command == 'JOIN':
+            for channel in rest.split(','):
+                self.joined(channel)
+        elif command == 'MODE':
+            self.send(f':{self.nick}!b@bench MODE {rest}')
+        elif command == 'PRIVMSG':
+            targets, _, text = rest.partition(' :')
+            for target in targets.split(','):
+                if target in self.members:
+                    self.said(text)
+                else:
+                    delay = random.uniform(0, self.think)
+                    self.loop.call_later(delay, self.answer, target)
+
+    def joined(self, channel):
+        members = self.members.get(channel, [])
+        self.send(f':{self.nick}!b@bench JOIN {channel}')
+        self.send(f":srv 353 {self.nick} = {channel} :{self.nick} "
+                  f"{' '.join(members)}")
+        self.send(f':srv 366 {self.nick} {channel} :End of /NAMES list.')
+        for nick in members:
+            self.player(nick, channel, '!join')
+
+    def answer(self, nick):
+        self.sent[nick] = time.perf_counter()
+        self.player(nick, self.nick, f'le fragment de {nick}')
+
+    def said(self, text):
+        if text.startswith(SENTENCE):
+            self.games += 1
+            return
+        match = COUNTED_RE.search(text)
+        if match and match.group(1) in self.sent:
+            sent = self.sent.pop(match.group(1))
+            self.latencies.append(time.perf_counter() - sent)
+
+
+def main(channels, players, seconds, think, save=False):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    names = [f'#bench{i}' for i in range(channels)]
+    server = Server(loop, names, players, think)
+    listening = loop.run_until_complete(
+        asyncio.start_server(server.handle, '127.0.0.1', 0))
+    port = listening.sockets[0].getsockname()[1]
+
+    bot = irc3.IrcBot(loop=loop, host='127.0.0.1', port=port, ssl=False,
+                      autojoins=names, **BOT_CONFIG)
+    bot.run(forever=False)
+    start = time.perf_counter()
+    loop.run_until_complete(asyncio.sleep(seconds))
+    elapsed = time.perf_counter() - start
+    listening.close()
+
+    if not server.latencies:
+        sys.exit('no game was played')
+    name = f'load_{channels}x{players}'
+    results = {name: dict(
+        games_per_sec=round(server.games / elapsed, 1),
+        msgs_per_sec=round(server.lines / elapsed, 1),
+        **summarize(server.latencies, len(server.latencies), elapsed),
+    )}
+    # the throughput of answers is already given by games_per_sec
+    del results[name]['per_sec']
+    report(results, save)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--players', type=int, default=24)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--think', type=float, default=.05)
+    parser.add_argument('--save', action='store_true')
+    args = parser.parse_args()
+    main(args.channels, args.players, args.seconds, args.think, args.save)
@@ -0,0 +1,143 @@
+"""Micro-benchmarks of the hot paths of the game engine.
+
+    python benchmarks/micro.py [--save]
+
+Each case is run in batches, the latency reported is the one of a single
+call averaged over a batch. --save stores the results as the baseline the
+next runs are compared to. The baseline depends on the machine, so it isn't
+kept in the repository: save one before changing the code.
+"""
+import sys
+import time
+
+from common import offline_bot, run_once, summarize, report
+
+import irc3
+from irc3.plugins.command import Commands
+
+from cadavre import data
+from cadavre.bot import Cadavre, State
+from cadavre.irc_colors import IRCColors as colors
+
+BATCH = 100
+SECONDS = 1
+
+
+def measure(func):
+    """Run func in batches for SECONDS, summarize the calls"""
+    samples = []
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        before = time.perf_counter()
+        for _ in range(BATCH):
+            func()
+        samples.append((time.perf_counter() - before) / BATCH)
+        count += BATCH
+    return summarize(samples, count, time.perf_counter() - start)
+
+
+def bench_assemble_sentence():
+    parts = [examples[0] for examples in data.EXAMPLES.values()]
+    return measure(lambda: data.assemble_sentence(parts))
+
+
+def bench_strip():
+    plain = "le pape confiant s'amuse avec des hommes terrifiés"
+    colored = colors.bold_green(plain) + ' ' + colors.red(plain)
+    return {
+        'strip_plain': measure(lambda: colors.strip(plain)),
+        'strip_colored': measure(lambda: colors.strip(colored)),
+    }
+
+
+def bench_tags():
+    return measure(lambda: colors.bold_green('fragment'))
+
+
+def bench_guard(masks=200):
+    bot, loop = offline_bot()
+    guard = bot.get_plugin(Commands).guard
+    config = {f'*!*@host{i}.example.org': 'all_permissions'
+              for i in range(masks)}
+    config['*'] = 'help,view,play'
+    # compiled again at the first check
+    bot.config[guard.key] = config
+    mask = irc3.utils.IrcString('player!user@somewhere.example.net')
+    return measure(lambda: guard.has_permission(mask, 'play'))
+
+
+def playing_bot(players=6):
+    """An offline bot with a game running on #bench"""
+    bot, loop = offline_bot()
+    plugin = bot.get_plugin(Cadavre)
+    game = plugin.games['#bench']
+    nicks = [f'p{i}' for i in range(players)]
+    for nick in nicks:
+        bot.dispatch(f':{nick}!u@h PRIVMSG #bench :!join')
+    run_once(loop)
+    return bot, loop, plugin, game, nicks
+
+
+def bench_dispatch():
+    bot, loop, plugin, game, nicks = playing_bot()
+    line = f':{nicks[0]}!u@h PRIVMSG bench :un fragment'
+
+    def dispatch():
+        bot.dispatch(line)
+        run_once(loop)
+    return measure(dispatch)
+
+
+def bench_start(busy):
+    """Open and close a table on #bench while busy other channels play"""
+    channels = ['#bench'] + [f'#busy{i}' for i in range(busy)]
+    bot, loop = offline_bot(channels)
+    plugin = bot.get_plugin(Cadavre)
+    for channel in channels[1:]:
+        for i in range(6):
+            bot.dispatch(f':{channel[1:]}p{i}!u@h PRIVMSG {channel} :!join')
+    run_once(loop)
+    game = plugin.games['#bench']
+    nicks = [f'p{i}' for i in range(6)]
+
+    def start():
+        table = game.open_table(nicks)
+        table.disarm_fill()
+        game.close_table(table)
+        run_once(loop)
+    return measure(start)
+
+
+def bench_cycle():
+    bot, loop, plugin, game, nicks = playing_bot()
+    game.reset()
+    game.state = State.queue
+
+    def cycle():
+        for nick in nicks:
+            game.add_pending(nick)
+        game.matchmake()
+        table = game.tables[0]
+        for nick in table.players:
+            table.on_fragment(nick, f'fragment de {nick}')
+        table.announce_game_end()
+        game.reset()
+        run_once(loop)
+    return measure(cycle)
+
+
+def main(save=False):
+    results = {'assemble_sentence': bench_assemble_sentence()}
+    results.update(bench_strip())
+    results['tag'] = bench_tags()
+    results['guard'] = bench_guard()
+    results['dispatch'] = bench_dispatch()
+    results['start'] = bench_start(0)
+    results['start_busy'] = bench_start(63)
+    results['cycle'] = bench_cycle()
+    report(results, save)
+
+
+if __name__ == '__main__':
+    main(save='--save' in sys.argv[1:])
@@ -1,7 +1,11 @@
 from irc3.plugins.command import command
 
+from .metrics import timed
+from .profiling import PROFILER, save_profile, save_snapshot
+
 
 @command(permission='admin', use_shlex=False, options_first=True)
+@timed
 def dispatch(bot, mask, target, args):
     """Fake some input
         %%dispatch <data>...
@@ -12,6 +16,7 @@ def dispatch(bot, mask, target, args):
 
 
 @command(permission='admin')
+@timed
 def reload(bot, mask, target, args):
     """Reload plugins
 
@@ -22,6 +27,7 @@ def reload(bot, mask, target, args):
 
 
 @command(name='as', permission='admin', options_first=True)
+@timed
 def as_cmd(bot, mask, target, args):
     """Simulate a message from another nick
 
@@ -31,3 +37,58 @@ def as_cmd(bot, mask, target, args):
     message = ' '.join(args['<message>'])
 
     bot.dispatch(f':{nick}!{nick}@{nick} PRIVMSG {bot.nick} :{message}')
+
+
+@command(permission='admin')
+@timed
+async def profile(bot, mask, target, args):
+    """Profile the bot, sending a summary in private
+
+        %%profile start [<seconds>]
+        %%profile stop
+        %%profile memory [stop]
+
+    start/stop profile the calls made by the event loop, memory shows what
+    grew since the last snapshot. Results are also written to files.
+    """
+    config = bot.config.get(__name__, {})
+    directory = config.get('profile_dir', '.')
+    count = int(config.get('profile_top', 10))
+
+    if args['memory']:
+        if args['stop']:
+            PROFILER.stop_tracing()
+            return 'Stopped tracing allocations'
+        previous, snapshot = PROFILER.snap()
+        path, lines = await bot.loop.run_in_executor(
+            None, save_snapshot, previous, snapshot, directory, count)
+        send_report(bot, mask.nick, path, lines)
+    elif args['start']:
+        if not PROFILER.start():
+            return 'Already profiling'
+        if args['<seconds>']:
+            def timeout():
+                bot.loop.create_task(
+                    report_profile(bot, mask.nick, directory, count))
+            PROFILER.timer = bot.loop.call_later(
+                float(args['<seconds>']), timeout)
+        return 'Profiling'
+    elif not PROFILER.running:
+        return 'Not profiling'
+    else:
+        await report_profile(bot, mask.nick, directory, count)
+
+
+async def report_profile(bot, nick, directory, count):
+    stats = PROFILER.stop()
+    if stats is None:
+        return
+    path, lines = await bot.loop.run_in_executor(
+        None, save_profile, stats, directory, count)
+    send_report(bot, nick, path, lines)
+
+
+def send_report(bot, nick, path, lines):
+    bot.privmsg(nick, f'written to {path}')
+    for line in lines:
+        bot.privmsg(nick, line)
@@ -0,0 +1,218 @@
+import re
+import json
+import heapq
+import sqlite3
+import unicodedata
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['Archive', 'Record', 'words']
+
+Record = collections.namedtuple(
+    'Record', 'id channel time seed players pieces parts delays')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def words(text):
+    """
+    Normalized words of text, as stored in the search index.
+
+    >>> words("Le Pape s'amuse près du lampadaire")
+    ['le', 'pape', 's', 'amuse', 'pres', 'du', 'lampadaire']
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return WORD_RE.findall(text)
+
+
+class Archive:
+    """Append-only store of finished games.
+
+    Games are kept in a local SQLite file, indexed by id and by channel,
+    along with an inverted index of the words of their fragments and of
+    their players that is updated with each insert. Every query runs in a
+    dedicated thread (which owns the connection) and returns an asyncio
+    future, so the event loop never waits on the disk.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY,
+            channel TEXT NOT NULL,
+            time REAL NOT NULL,
+            seed INTEGER,
+            players TEXT NOT NULL,
+            pieces TEXT NOT NULL,
+            parts TEXT NOT NULL,
+            delays TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS games_channel ON games (channel, id);
+        CREATE TABLE IF NOT EXISTS words (
+            word TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            game_id INTEGER NOT NULL,
+            PRIMARY KEY (word, channel, game_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS players (
+            nick TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            game_id INTEGER NOT NULL,
+            PRIMARY KEY (nick, channel, game_id)
+        ) WITHOUT ROWID;
+    '''
+
+    # bumped when the index needs to be rebuilt from the games
+    VERSION = 2
+
+    # games looked at per word of a search, newest first
+    SEARCH_WALK = 1000
+
+    def __init__(self, path, loop):
+        self.path = path
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.db = None
+
+    def run(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path)
+            self.db.executescript(self.SCHEMA)
+            version, = self.db.execute('PRAGMA user_version').fetchone()
+            if version < self.VERSION:
+                self.reindex()
+        return self.db
+
+    def reindex(self):
+        db = self.db
+        with db:
+            db.execute('DELETE FROM words')
+            db.execute('DELETE FROM players')
+            for row in db.execute('SELECT * FROM games'):
+                self.index(self.to_record(row))
+            db.execute(f'PRAGMA user_version = {self.VERSION}')
+
+    def index(self, record):
+        key = (record.channel, record.id)
+        self.db.executemany(
+            'INSERT OR IGNORE INTO words VALUES (?, ?, ?)',
+            ((word, *key) for word in set(words(' '.join(record.parts)))))
+        self.db.executemany(
+            'INSERT OR IGNORE INTO players VALUES (?, ?, ?)',
+            ((nick.lower(), *key) for nick in record.players))
+
+    @staticmethod
+    def to_record(row):
+        id, channel, time, seed, *lists = row
+        return Record(id, channel, time, seed, *map(json.loads, lists))
+
+    # writes
+
+    def record(self, channel, time, seed, players, pieces, parts, delays):
+        """Store a finished game, the future gives its id"""
+        record = Record(None, channel, time, seed,
+                        players, pieces, parts, delays)
+        return self.run(self.insert, record)
+
+    def insert(self, record):
+        db = self.connect()
+        row = (record.channel, record.time, record.seed,
+               *(json.dumps(value, ensure_ascii=False)
+                 for value in record[4:]))
+        with db:
+            cursor = db.execute(
+                'INSERT INTO games (channel, time, seed, players, pieces, '
+                'parts, delays) VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+            self.index(record._replace(id=cursor.lastrowid))
+        return cursor.lastrowid
+
+    # reads
+
+    def get(self, channel, game_id):
+        """Future of the Record of channel with that id, or None"""
+        return self.run(self.select_game, channel, game_id)
+
+    def select_game(self, channel, game_id):
+        row = self.connect().execute(
+            'SELECT * FROM games WHERE id = ? AND channel = ?',
+            (game_id, channel)).fetchone()
+        return self.to_record(row) if row else None
+
+    def select_one(self, game_id):
+        row = self.connect().execute(
+            'SELECT * FROM games WHERE id = ?', (game_id,)).fetchone()
+        return self.to_record(row) if row else None
+
+    def history(self, channel, count):
+        """Future of the last count Records of channel, newest first"""
+        return self.run(self.select_history, channel, count)
+
+    def select_history(self, channel, count):
+        rows = self.connect().execute(
+            'SELECT * FROM games WHERE channel = ? ORDER BY id DESC LIMIT ?',
+            (channel, count))
+        return [self.to_record(row) for row in rows]
+
+    def search(self, channel, text, count):
+        """Future of the count Records of channel matching most words of
+        text, newest first among equals. Only the newest SEARCH_WALK games
+        of a word are walked, older games need a rarer word to be found."""
+        return self.run(self.select_search, channel, words(text), count)
+
+    def select_search(self, channel, query, count):
+        db = self.connect()
+        # the newest games of each word, whole for the rare ones: a common
+        # word only brings its SEARCH_WALK newest games, older ones are
+        # found through the rarer words of the query
+        postings = {}
+        for word in set(query):
+            postings[word] = {id for id, in db.execute(
+                'SELECT game_id FROM words WHERE word = ? AND channel = ? '
+                'ORDER BY game_id DESC LIMIT ?',
+                (word, channel, self.SEARCH_WALK))}
+        candidates = set().union(*postings.values())
+        scores = collections.Counter()
+        for word, ids in postings.items():
+            scores.update(ids)
+            if len(ids) < self.SEARCH_WALK:
+                continue
+            # the walk stopped early, look the older candidates up
+            oldest = min(ids)
+            older = sorted(id for id in candidates if id < oldest)
+            for start in range(0, len(older), 500):
+                batch = older[start:start + 500]
+                marks = ', '.join('?' * len(batch))
+                scores.update(id for id, in db.execute(
+                    f'SELECT game_id FROM words WHERE word = ? AND '
+                    f'channel = ? AND game_id IN ({marks})',
+                    (word, channel, *batch)))
+        return self.select_ids(heapq.nlargest(
+            count, candidates, key=lambda id: (scores[id], id)))
+
+    def by_player(self, channel, nick, count):
+        """Future of the last count Records of channel played by nick"""
+        return self.run(self.select_by_player, channel, nick, count)
+
+    def select_by_player(self, channel, nick, count):
+        ids = self.connect().execute(
+            'SELECT game_id FROM players WHERE nick = ? AND channel = ? '
+            'ORDER BY game_id DESC LIMIT ?',
+            (nick.lower(), channel, count)).fetchall()
+        return self.select_ids(id for id, in ids)
+
+    def delays(self, consume):
+        """Future of what consume returns, given the (players, pieces,
+        delays) of every game one at a time in the archive thread"""
+        return self.run(lambda: consume(self.select_delays()))
+
+    def select_delays(self):
+        rows = self.connect().execute(
+            'SELECT players, pieces, delays FROM games ORDER BY id')
+        for row in rows:
+            yield tuple(map(json.loads, row))
+
+    def select_ids(self, ids):
+        return [self.select_one(id) for id in ids]
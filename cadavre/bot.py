@@ -1,19 +1,44 @@
+import os
 import re
+import sys
 import enum
 import time
-import copy
+import functools
 import random
+import traceback
 
 import irc3
 from irc3.plugins.command import command
-from irc3.plugins.cron import cron
-from irc3.utils import IrcString
 
 from . import data
+from .archive import Archive
+from .checkpoint import Checkpoint
+from .corpus import Corpus
+from .metrics import REGISTRY, timed
+from .output import Output, CRITICAL, NORMAL, COSMETIC, PRIORITY_NAMES
+from .pacing import Pacing
+from .prompts import prompt
+from .replay import Recorder
+from .stats import Stats
+from .timers import DeadlineHeap
+from .watchdog import Watchdog, offloadable
 from .irc_colors import IRCColors as colors
 
 TRUE_FALSE = (True, False)
 
+REGISTRY.describe('cadavre_state_seconds', 'histogram',
+                  'Time tables stay in each state')
+REGISTRY.describe('cadavre_games_total', 'counter', 'Games played')
+
+# version of the layout of the plugin state, see Cadavre.STATE
+STATE_VERSION = 10
+
+# keys of the plugin state besides channel names
+PLAYERS_KEY = 'players'
+VERSION_KEY = 'version'
+# prefix of the keys of the player and piece statistics
+STATS_KEY = 'stats/'
+
 
 class State(enum.IntEnum):
     wait_for_names = enum.auto()
@@ -32,6 +57,10 @@ class State(enum.IntEnum):
 
 
 class PlayTime:
+    """How long a player stays in the waiting room: a number of games or a
+    deadline, the other is None"""
+    __slots__ = ('count', 'deadline')
+
     RE_TIME = re.compile(r'^(\d*(?:\.\d+)?)([smh]?)$', re.ASCII)
     UNITS = dict(s=1, m=60, h=3600)
 
@@ -41,198 +70,1125 @@ class PlayTime:
         if not m:
             raise ValueError('Invalid time format')
 
-        self.time_unit = m.group(2)
-        if self.time_unit:
+        self.count = None
+        self.deadline = None
+        time_unit = m.group(2)
+        if time_unit:
             self.deadline = time.time() + (
-                                float(m.group(1)) * self.UNITS[self.time_unit])
+                                float(m.group(1)) * self.UNITS[time_unit])
         else:
             self.count = int(m.group(1))
 
     def count_game(self):
-        if not self.time_unit:
+        if self.count is not None:
             self.count -= 1
 
     def check_time(self):
         "Returns True if the player is allowed to play now"
 
-        if self.time_unit:
+        if self.deadline is not None:
             return time.time() < self.deadline
         else:
             return self.count > 0
 
+    def to_state(self):
+        return dict(count=self.count, deadline=self.deadline)
+
+    @classmethod
+    def from_state(cls, state):
+        self = cls.__new__(cls)
+        # older layouts only have the one in use, along with a time_unit
+        self.count = state.get('count')
+        self.deadline = state.get('deadline')
+        return self
+
     def __repr__(self):
-        if not self.time_unit:
+        if self.deadline is None:
             return f'PlayTime(count={self.count})'
         else:
             return f'PlayTime(deadline={self.deadline})'
 
 
-@irc3.plugin
-class Cadavre:
-    requires = [
-        'irc3.plugins.command',
-        'irc3.plugins.userlist'
-    ]
+class Player:
+    """What the plugin knows of a nick: the game it waits or plays in and
+    for how long. Dropped once it has neither."""
+    __slots__ = ('nick', 'game', 'play_time')
 
-    @classmethod
-    def reload(cls, old):
-        self = cls(old.bot)
+    def __init__(self, nick):
+        # the sets and dicts of the games all share this string
+        self.nick = sys.intern(nick)
+        self.game = None
+        self.play_time = None
 
-        for attr, value in old.__dict__.items():
-            if attr == 'bot':
-                continue
-            setattr(self, attr, copy.deepcopy(value))
+    def __repr__(self):
+        channel = self.game.channel_name if self.game else None
+        return (f'Player({self.nick!r}, game={channel!r}, '
+                f'play_time={self.play_time!r})')
 
-        if self.state == State.post_game_cooldown:
-            self.waiting_room()
-        elif self.state == State.game_grace_period:
-            self.announce_game_end()
 
-        return self
+class Game:
+    """The waiting queue of a single channel and the tables it feeds"""
 
-    def __init__(self, bot):
-        self.channel_name = irc3.utils.as_list(bot.config.autojoins)[0]
-        self.bot = bot
+    def __init__(self, plugin, channel_name):
+        self.plugin = plugin
+        self.channel_name = channel_name
         self.state = None
         self.last_game = None
         self.subscribed_players = set()
-        self.player_times = {}
-        self.reset()
+        self.pending_players = set()
+        self.tables = []
+        self.player_tables = {}
+        # who has +v as the server told us, the changes we sent it but
+        # haven't seen back, and nicks whose voice may not match the queue
+        # until the next sync
+        self.voiced = set()
+        self.voicing = {}
+        self.unsynced = set()
+        config = plugin.config
+        self.pacing = Pacing(grace=float(config.get('grace_period', 4)),
+                             cooldown=float(config.get('cooldown', 6)))
+
+    def to_state(self):
+        return dict(
+            state=self.state.name if self.state else None,
+            last_game=self.last_game,
+            subscribed_players=sorted(self.subscribed_players),
+            pending_players=sorted(self.pending_players),
+            tables=[table.to_state() for table in self.tables],
+        )
 
-    def connection_made(self):
-        self.bot.send('CAP REQ :multi-prefix')
+    @classmethod
+    def from_state(cls, plugin, channel_name, state):
+        self = cls(plugin, channel_name)
+        if state['state']:
+            self.state = State[state['state']]
+        if state['last_game']:
+            self.last_game = tuple(state['last_game'])
+        self.subscribed_players = set(map(sys.intern,
+                                          state['subscribed_players']))
+        for nick in state['pending_players']:
+            player = plugin.player(nick)
+            player.game = self
+            self.pending_players.add(player.nick)
+        for table_state in state['tables']:
+            table = Table.from_state(self, table_state)
+            self.tables.append(table)
+            for nick in table.players:
+                self.player_tables[nick] = table
+                plugin.player(nick).game = self
+        return self
 
-    def reset(self):
-        self.pending_players = set()
-        self.player_pieces = {}
-        self.players = []
-        self.pieces = {}
-        self.start_time = None
-        self.blame_users = set()
+    def changed(self):
+        self.plugin.changed(self.channel_name)
+
+    @property
+    def bot(self):
+        return self.plugin.bot
+
+    def idle_players(self):
+        return [nick for nick in self.pending_players
+                if nick not in self.player_tables]
+
+    def ready(self, table):
+        """Whether a full table can start once table is closed"""
+        waiting = [nick for nick in self.pending_players
+                   if self.player_tables.get(nick) in (None, table)]
+        return len(waiting) >= max(data.MODES)
+
+    def playing(self):
+        return [table for table in self.tables
+                if table.state in State.game_states()]
+
+    def add_pending(self, nick):
+        player = self.plugin.player(nick)
+        player.game = self
+        self.pending_players.add(player.nick)
+        self.changed()
+
+    def discard_pending(self, nick):
+        self.pending_players.discard(nick)
+        self.plugin.release(self, nick)
+        self.changed()
+
+    def has_voice(self, nick):
+        """Whether nick has +v once the changes we sent are applied"""
+        sign = self.voicing.get(nick)
+        if sign is not None:
+            return sign == '+'
+        return nick in self.voiced
 
     def mode_nick(self, mode, *nicks):
+        """Give or take +v, leaving out those that already are as asked"""
+        sign = mode[0]
+        nicks = [nick for nick in nicks
+                 if self.has_voice(nick) != (sign == '+')]
         if not nicks:
             return
-        sign, mode = mode
-        self.bot.mode(self.channel_name, sign + mode * len(nicks), *nicks)
+        for nick in nicks:
+            self.voicing[nick] = sign
+        self.plugin.output.mode(self.channel_name, mode, *sorted(nicks))
 
-    def ensure_state(self, *states):
-        if self.state not in states:
-            raise RuntimeError(
-                f"expected to be in states {states}, but is {self.state}")
+    # voices mirror
+
+    def names(self):
+        """Start over from the user list, once its names are known"""
+        self.voiced = set(self.channel.modes['+'])
+        self.voicing.clear()
+        self.unsynced.clear()
+
+    def on_voice(self, sign, nick):
+        if sign == '+':
+            self.voiced.add(nick)
+        else:
+            self.voiced.discard(nick)
+        if self.voicing.get(nick) == sign:
+            del self.voicing[nick]
+        elif nick not in self.voicing:
+            # not ours, check it against the queue at the next sync
+            self.unsynced.add(nick)
+
+    def on_leave(self, nick):
+        self.voiced.discard(nick)
+        self.voicing.pop(nick, None)
+        self.unsynced.discard(nick)
+
+    def on_rename(self, nick, new_nick):
+        for nicks in (self.voiced, self.unsynced):
+            if nick in nicks:
+                nicks.discard(nick)
+                nicks.add(new_nick)
+        if nick in self.voicing:
+            self.voicing[new_nick] = self.voicing.pop(nick)
+
+    def on_refused(self):
+        """Our mode changes were refused, forget about them"""
+        self.voicing.clear()
 
     @property
     def channel(self):
         return self.bot.channels[self.channel_name]
 
-    def say(self, msg, to=None):
-        self.bot.privmsg(to or self.channel_name, msg)
+    def say(self, msg, to=None, priority=NORMAL):
+        self.plugin.output.privmsg(to or self.channel_name, msg, priority)
 
     def handle_part(self, nick):
-        self.pending_players.discard(nick)
-        # we are in-game, nick has a role, they did not give their answer
-        # TODO: fill-in missing pieces instead
-        # or use some non-playing pending player
-        if (self.state == State.game
-                and nick in self.player_pieces
-                and self.player_pieces[nick] not in self.pieces):
-            self.say(f"gros con de {nick}, on abandonne")
-            self.end_game()
+        self.discard_pending(nick)
+        table = self.player_tables.get(nick)
+        if table is not None:
+            table.handle_part(nick)
 
-    @irc3.event(irc3.rfc.JOIN)
-    def on_join(self, mask, channel, **kw):
-        if channel == self.channel_name and mask.nick == self.bot.nick:
-            self.state = State.wait_for_names
-
-    @irc3.event(irc3.rfc.RPL_ENDOFNAMES)
-    def on_endofnames(self, me, channel, **kw):
+    def on_endofnames(self):
         if self.state != State.wait_for_names:
             return
-        self.pending_players = set(self.channel.modes['+'])
+        self.names()
+        for nick in self.voiced:
+            if self.plugin.player_game(nick) is None:
+                self.add_pending(nick)
         self.state = State.queue
+        # tables restored from a checkpoint
+        for table in list(self.tables):
+            table.resume()
 
-    @irc3.event(irc3.rfc.PART)
-    def on_part(self, mask, channel, data):
-        if channel == self.channel_name:
-            self.handle_part(mask.nick)
+    def join(self, nick):
+        if nick in self.pending_players:
+            return
 
-    @irc3.event(irc3.rfc.QUIT)
-    def on_quit(self, mask, data):
-        self.handle_part(mask.nick)
+        self.add_pending(nick)
 
-    @irc3.event(irc3.rfc.KICK)
-    def on_kick(self, mask, channel, data):
-        if channel == self.channel_name:
-            self.handle_part(mask.nick)
+        if self.state != State.queue:
+            self.unsynced.add(nick)
+            return
+        self.mode_nick('+v', nick)
+        if nick in self.player_tables:
+            return
+        self.matchmake()
+        if nick not in self.player_tables and self.playing():
+            return f"{nick}: je note pour la prochaine partie"
+
+    def part(self, nick):
+        table = self.player_tables.get(nick)
+        if table is not None and table.state in State.game_states():
+            # in game, defer -v
+            self.unsynced.add(nick)
+            if nick in self.pending_players:
+                self.discard_pending(nick)
+                return f"{nick}: ok bisous"
+            return
+        self.discard_pending(nick)
+        self.mode_nick('-v', nick)
 
-    @irc3.event(irc3.rfc.PRIVMSG)
-    def on_private_message(self, mask, event, target, data):
-        data = colors.strip(data).strip()
+    def matchmake(self, everyone=False):
+        """Seat idle players at new tables
 
-        if data.startswith(self.bot.config.get('cmd', '!')):
+        Full tables are started as soon as enough players are waiting; with
+        everyone set, all idle players are split into tables right away.
+        """
+        if self.state != State.queue:
+            return
+        # sets iterate in a different order in each process, sort them so
+        # that only the seed of the generator matters
+        idle = sorted(self.idle_players())
+        random.shuffle(idle)
+        if everyone:
+            sizes = data.table_sizes(len(idle))
+        else:
+            sizes = [max(data.MODES)] * (len(idle) // max(data.MODES))
+        for size in sizes:
+            players, idle = idle[:size], idle[size:]
+            self.open_table(players)
+
+    def open_table(self, players):
+        numbers = {table.number for table in self.tables}
+        number = next(n for n in range(1, len(numbers) + 2)
+                      if n not in numbers)
+        table = Table(self, number, players)
+        self.tables.append(table)
+        for nick in players:
+            self.player_tables[nick] = table
+        table.start_game()
+        self.changed()
+        return table
+
+    def close_table(self, table):
+        self.tables.remove(table)
+        for nick in table.players:
+            if self.player_tables.get(nick) is table:
+                del self.player_tables[nick]
+                self.plugin.release(self, nick)
+        self.changed()
+
+    def sync_voices(self):
+        # voice deferred pending, unvoice deferred leaving
+        voice = []
+        devoice = []
+        for nick in list(self.unsynced):
+            table = self.player_tables.get(nick)
+            if nick in self.pending_players:
+                voice.append(nick)
+            elif table is not None and table.state in State.game_states():
+                # still busy, wait for the end of its game
+                continue
+            else:
+                devoice.append(nick)
+            self.unsynced.discard(nick)
+        self.mode_nick('+v', *voice)
+        self.mode_nick('-v', *devoice)
+
+    def reset(self):
+        self.unsynced.update(self.pending_players, self.player_tables)
+        for table in list(self.tables):
+            self.close_table(table)
+        for nick in list(self.pending_players):
+            self.discard_pending(nick)
+
+
+class Table:
+    """A single game played by some of the players of a channel"""
+
+    def __init__(self, game, number, players):
+        self.game = game
+        self.number = number
+        self.state = None
+        self.entered = time.monotonic()
+        self.players = list(players)
+        self.player_pieces = {}
+        self.pieces = {}
+        self.delays = {}
+        self.seed = None
+        self.start_time = None
+        self.blame_users = set()
+        # piece -> (gender, plurality), and the prompt sent for it
+        self.specs = {}
+        self.prompts = {}
+        # pieces we had to make up
+        self.filled = set()
+        self.filling = None
+        # whether a fragment was fixed during the grace period
+        self.corrected = False
+
+    def to_state(self):
+        elapsed = None
+        if self.start_time is not None:
+            elapsed = time.monotonic() - self.start_time
+        return dict(
+            number=self.number,
+            state=self.state.name,
+            players=list(self.players),
+            player_pieces=dict(self.player_pieces),
+            pieces=dict(self.pieces),
+            delays=dict(self.delays),
+            seed=self.seed,
+            elapsed=elapsed,
+            blame_users=sorted(self.blame_users),
+            specs=dict(self.specs),
+            prompts=dict(self.prompts),
+            filled=sorted(self.filled),
+        )
+
+    @classmethod
+    def from_state(cls, game, state):
+        self = cls(game, state['number'], state['players'])
+        self.state = State[state['state']]
+        self.player_pieces = state['player_pieces']
+        self.pieces = state['pieces']
+        self.delays = state['delays']
+        self.seed = state['seed']
+        if state['elapsed'] is not None:
+            self.start_time = time.monotonic() - state['elapsed']
+        self.blame_users = set(state['blame_users'])
+        self.specs = {piece: tuple(spec)
+                      for piece, spec in state.get('specs', {}).items()}
+        self.prompts = state.get('prompts', {})
+        self.filled = set(state.get('filled', ()))
+        return self
+
+    def enter(self, state):
+        """Move to state, measuring how long we stayed in the last one"""
+        now = time.monotonic()
+        if self.state is not None:
+            REGISTRY.observe('cadavre_state_seconds', now - self.entered,
+                             state=self.state.name)
+        self.state = state
+        self.entered = now
+
+    def resume(self):
+        """Pick up a table restored from a checkpoint"""
+        if self.state == State.game:
+            self.arm_fill()
+        elif self.state == State.game_grace_period:
+            self.bot.loop.call_later(self.game.pacing.grace_delay(),
+                                     self.announce_game_end)
+        elif self.state == State.post_game_cooldown:
+            self.waiting_room()
+
+    @property
+    def bot(self):
+        return self.game.bot
+
+    @property
+    def label(self):
+        return f"[table {self.number}] " if self.number > 1 else ""
+
+    def ensure_state(self, *states):
+        if self.state not in states:
+            raise RuntimeError(
+                f"expected to be in states {states}, but is {self.state}")
+
+    def say(self, msg, to=None, priority=NORMAL):
+        if to is None:
+            msg = self.label + msg
+        self.game.say(msg, to=to, priority=priority)
+
+    def missing(self):
+        return set(nick for nick, piece in self.player_pieces.items()
+                   if piece not in self.pieces)
+
+    def handle_part(self, nick):
+        # we are in-game, nick has a role, they did not give their answer
+        if (self.state == State.game
+                and nick in self.player_pieces
+                and self.player_pieces[nick] not in self.pieces):
+            idle = [player for player in sorted(self.game.idle_players())
+                    if player != nick]
+            piece = self.player_pieces[nick]
+            if idle and piece in self.prompts:
+                substitute = random.choice(idle)
+                self.say(f"{nick} s'est barré, {substitute} prend sa place")
+                self.hand_over(nick, substitute)
+            else:
+                self.say(f"{nick} s'est barré, je complète son fragment")
+                self.fill_in([nick])
+
+    def hand_over(self, nick, substitute):
+        """Give the piece of nick to a player waiting for the next game"""
+        piece = self.player_pieces.pop(nick)
+        self.player_pieces[substitute] = piece
+        self.players[self.players.index(nick)] = substitute
+        del self.game.player_tables[nick]
+        self.game.plugin.release(self.game, nick)
+        self.game.player_tables[substitute] = self
+        self.game.plugin.player_stats.aborted(nick)
+        self.game.changed()
+        self.say(self.prompts[piece], to=substitute, priority=CRITICAL)
+
+    def fill_in(self, nicks):
+        """Make up the pieces of nicks from the examples"""
+        # the shared generator, so that replays make up the same pieces
+        rng = random
+        for nick in nicks:
+            piece = self.player_pieces[nick]
+            gender, plurality = self.specs.get(piece, (None, None))
+            self.pieces[piece] = self.game.plugin.example(
+                piece, gender, plurality, rng)
+            self.filled.add(piece)
+        self.game.changed()
+        if len(self.pieces) == len(self.player_pieces):
+            self.enter_grace_period()
+
+    def arm_fill(self):
+        timeout = float(self.game.plugin.config.get('fill_timeout', 180))
+        if timeout > 0:
+            timeout = self.game.pacing.fill_delay(timeout)
+            delay = max(0, self.start_time + timeout - time.monotonic())
+            self.filling = self.bot.loop.call_later(delay, self.fill_timeout)
+
+    def disarm_fill(self):
+        if self.filling is not None:
+            self.filling.cancel()
+            self.filling = None
+
+    def fill_timeout(self):
+        self.filling = None
+        if self not in self.game.tables or self.state != State.game:
             return
+        slow = sorted(self.missing())
+        self.say(f"{', '.join(slow)}: trop tard, je complète")
+        self.fill_in(slow)
+
+    def on_fragment(self, nick, data):
         if self.state not in State.game_states():
             return
-        if target != self.bot.nick:
+        if nick not in self.player_pieces:
             return
-        if mask.nick not in self.player_pieces:
+
+        data = colors.strip(data).strip()
+        if data.startswith(self.bot.config.get('cmd', '!')):
             return
 
-        piece = self.player_pieces[mask.nick]
-        already = piece in self.pieces
+        piece = self.player_pieces[nick]
+        already = piece in self.pieces and piece not in self.filled
         self.pieces[piece] = data
+        self.filled.discard(piece)
+        self.game.changed()
+        if self.state == State.game_grace_period:
+            self.corrected = True
 
         counter = f"[{len(self.pieces)}/{len(self.player_pieces)}] "
 
         if not already:
             delay = time.monotonic() - self.start_time
-            msg = f"{mask.nick} m'a donné son fragment en {delay:.1f} sec"
-            self.say(counter + msg)
+            self.delays[piece] = delay
+            self.game.pacing.answered(delay)
+            self.game.plugin.player_stats.answered(nick, piece, delay)
+            msg = f"{nick} m'a donné son fragment en {delay:.1f} sec"
+            self.say(counter + msg, priority=COSMETIC)
 
         if len(self.pieces) == len(self.player_pieces):
             self.enter_grace_period()
 
+    @timed
+    def start_game(self):
+        self.ensure_state(None)
+
+        # keep the seed so that archived games can be replayed
+        self.seed = random.getrandbits(32)
+        rng = random.Random(self.seed)
+
+        subject_gender = rng.choice(TRUE_FALSE)
+        object_gender = rng.choice(TRUE_FALSE)
+        subject_plurality = rng.choice(TRUE_FALSE)
+        object_plurality = rng.choice(TRUE_FALSE)
+
+        rng.shuffle(self.players)
+
+        fragments = []
+        for player, piece in zip(self.players, data.MODES[len(self.players)]):
+            self.player_pieces[player] = piece
+
+            if piece == 'Cc':
+                gender = None
+                plurality = None
+            else:
+                subject = piece in data.SUBJECT_PIECES
+                gender = subject_gender if subject else object_gender
+                plurality = subject_plurality if subject else object_plurality
+
+            self.specs[piece] = (gender, plurality)
+            fragments.append(
+                self.game.plugin.example(piece, gender, plurality, rng))
+
+        for player in self.players:
+            piece = self.player_pieces[player]
+            msg = prompt(piece, *self.specs[piece], fragments)
+            self.prompts[piece] = msg
+            self.say(msg, to=player, priority=CRITICAL)
+
+        people = ", ".join(self.players)
+        msg = f"{people}: c'est parti, lisez vos PV pour savoir quoi m'envoyer"
+        self.start_time = time.monotonic()
+        self.say(msg)
+        self.enter(State.game)
+        self.game.changed()
+        self.arm_fill()
+
+    def enter_grace_period(self):
+        self.ensure_state(State.game)
+        self.disarm_fill()
+        self.enter(State.game_grace_period)
+        self.game.changed()
+        self.bot.loop.call_later(self.game.pacing.grace_delay(),
+                                 self.announce_game_end)
+
+    @timed
+    def announce_game_end(self):
+        if self not in self.game.tables:
+            # closed by a reset in the meantime
+            return
+        self.ensure_state(State.game_grace_period)
+        pieces = data.MODES[len(self.pieces)]
+        parts = [self.pieces[piece] for piece in pieces]
+        self.game.last_game = (list(self.players), list(parts))
+        self.game.plugin.archive_game(
+            channel=self.game.channel_name,
+            time=time.time(),
+            seed=self.seed,
+            players=list(self.players),
+            pieces=list(pieces),
+            parts=parts,
+            delays=[self.delays.get(piece) for piece in pieces])
+        authors = [nick for nick in self.players
+                   if self.player_pieces[nick] not in self.filled]
+        if authors:
+            self.say(f"merci à {', '.join(authors)}:", priority=CRITICAL)
+        sentence = data.assemble_sentence(parts)
+        self.say(f"\N{WHITE RIGHT-POINTING TRIANGLE} {sentence}",
+                 priority=CRITICAL)
+        REGISTRY.inc('cadavre_games_total', channel=self.game.channel_name)
+        self.end_game(sentence)
+
+    def end_game(self, sentence=''):
+        self.ensure_state(*State.game_states())
+        self.disarm_fill()
+        pacing = self.game.pacing
+        pacing.ended(self.corrected)
+
+        plugin = self.game.plugin
+        for player in self.players:
+            if self.player_pieces[player] in self.filled:
+                plugin.player_stats.aborted(player)
+            else:
+                plugin.player_stats.played(player)
+            play_time = plugin.play_time(player)
+            if play_time is not None:
+                play_time.count_game()
+                plugin.changed()
+                if not play_time.check_time():
+                    plugin.expire(player)
+
+        self.enter(State.post_game_cooldown)
+        self.game.changed()
+        self.game.sync_voices()
+
+        delay = pacing.cooldown_delay(sentence, self.game.ready(self))
+        self.bot.loop.call_later(delay, self.waiting_room)
+
+    def waiting_room(self):
+        if self not in self.game.tables:
+            # closed by a reset in the meantime
+            return
+        self.ensure_state(State.post_game_cooldown)
+        self.enter(None)
+        self.game.close_table(self)
+        self.say("on rejoue ?")
+        self.game.matchmake()
+
+
+@irc3.plugin
+class Cadavre:
+    requires = [
+        'irc3.plugins.command',
+        'irc3.plugins.userlist'
+    ]
+
+    # Attributes holding the live state of the plugin. When the layout of
+    # that state changes (or the one of Game, Table, Player and PlayTime),
+    # bump STATE_VERSION so that a reload goes through to_state/from_state.
+    STATE = ('games', 'players', 'deadlines', 'output',
+             'archive', 'checkpoint', 'dirty', 'saving', 'restored',
+             'player_stats', 'watchdog', 'recorder')
+
+    @classmethod
+    def reload(cls, old):
+        self = cls(old.bot)
+        if getattr(old, 'state_version', None) == STATE_VERSION:
+            self.adopt(old)
+        else:
+            self.from_state(old.to_state())
+            # those modules aren't reloaded, keep their objects
+            for attr in ('output', 'archive', 'checkpoint', 'restored',
+                         'player_stats', 'watchdog', 'recorder'):
+                if hasattr(old, attr):
+                    setattr(self, attr, getattr(old, attr))
+            old.deadlines.clear()
+            if old.saving is not None:
+                old.saving.cancel()
+            for key in old.dirty:
+                self.changed(key)
+            # the voices mirror isn't part of the state
+            for name, game in self.games.items():
+                old_game = old.games.get(name)
+                if hasattr(old_game, 'voiced'):
+                    game.voiced = old_game.voiced
+                    game.voicing = old_game.voicing
+                    game.unsynced = old_game.unsynced
+                elif game.state != State.wait_for_names:
+                    game.names()
+            # leave the old tables' pending timers nothing to act upon
+            for game in old.games.values():
+                game.tables.clear()
+            for game in self.games.values():
+                for table in list(game.tables):
+                    table.resume()
+        if self.watchdog is not None:
+            self.watchdog.report = self.stalled
+            self.watchdog.start()
+        self.player_stats.changed = self.stats_changed
+        self.bot.send_line = self.output.send_line
+        return self
+
+    def adopt(self, old):
+        """Take over the state of an older instance, moving it by reference
+
+        Only the objects pointing back to the plugin and the class of the
+        state objects are updated, so that they run the reloaded code.
+        """
+        for attr in self.STATE:
+            setattr(self, attr, getattr(old, attr))
+        self.deadlines.callback = self.expire
+
+        for game in self.games.values():
+            game.__class__ = Game
+            game.plugin = self
+            for table in game.tables:
+                table.__class__ = Table
+        for player in self.players.values():
+            player.__class__ = Player
+            if player.play_time is not None:
+                player.play_time.__class__ = PlayTime
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.config = bot.config.get(__name__, {})
+        self.state_version = STATE_VERSION
+        self.games = {}
+        # nick -> Player, for those waiting, playing or with a play time
+        self.players = {}
+        self.deadlines = DeadlineHeap(bot.loop, self.expire)
+        self.output = Output(bot)
+        # one flood control for all the lines
+        bot.send_line = self.output.send_line
+
+        path = self.config.get('corpus')
+        self.corpus = Corpus(path) if path else None
+
+        path = self.config.get('archive')
+        self.archive = Archive(path, bot.loop) if path else None
+
+        path = self.config.get('checkpoint')
+        self.checkpoint = Checkpoint(path, bot.loop) if path else None
+        self.dirty = set()
+        self.saving = None
+        self.restored = False
+        self.player_stats = Stats(self.stats_changed)
+        # all the tags, so that none is parsed while a game starts
+        colors.precompute()
+
+        # opened once connected, the events go with each new instance
+        self.recorder = None
+        if self.config.get('record'):
+            bot.attach_events(
+                irc3.event(r'(?s)(?P<raw>.*)', self.record_in),
+                irc3.event(r'(?s)(?P<raw>.*)', self.record_out, iotype='out'))
+
+        threshold = self.config.get('watchdog')
+        self.watchdog = None
+        if threshold:
+            # the watchdog asks the metrics which handler is running
+            REGISTRY.enabled = True
+            self.watchdog = Watchdog(bot.loop, self.stalled, float(threshold))
+
+        port = self.config.get('metrics_port')
+        if port or self.config.get('metrics') is True:
+            REGISTRY.enabled = True
+            self.gauges()
+        if port:
+            def done(future):
+                if future.exception() is not None:
+                    bot.log.error('could not serve metrics: %r',
+                                  future.exception())
+            bot.loop.create_task(REGISTRY.serve(int(port))).add_done_callback(
+                done)
+
+    def gauges(self):
+        def players():
+            for name, game in self.games.items():
+                yield dict(channel=name), len(game.idle_players())
+
+        def tables():
+            states = State.game_states() + (State.post_game_cooldown,)
+            for name, game in self.games.items():
+                for state in states:
+                    count = sum(table.state == state for table in game.tables)
+                    yield dict(channel=name, state=state.name), count
+
+        def games_per_hour():
+            for name, game in self.games.items():
+                yield dict(channel=name), game.pacing.games_per_hour()
+
+        def queued():
+            for priority, count in enumerate(self.output.queued):
+                yield dict(priority=PRIORITY_NAMES[priority]), count
+
+        REGISTRY.gauge('cadavre_waiting_players', players,
+                       'Players waiting for a table')
+        REGISTRY.gauge('cadavre_tables', tables, 'Tables in each state')
+        REGISTRY.gauge('cadavre_games_last_hour', games_per_hour,
+                       'Games ended in the last hour')
+        REGISTRY.gauge('cadavre_output_queued', queued,
+                       'Lines waiting for the flood control')
+
+    def connection_made(self):
+        # restore the checkpoint before joining, but only once: the state
+        # we have is the most recent one after a reconnection
+        if self.checkpoint is not None and not self.restored:
+            self.from_state(self.checkpoint.load())
+        # the checkpoint has counted the archived games already
+        if (self.archive is not None and not self.restored and
+                not self.player_stats.players):
+            self.load_stats()
+        path = self.config.get('record')
+        if path and not self.restored:
+            self.recorder = Recorder(path, self.bot.loop, self.bot.config)
+        self.restored = True
+        if self.watchdog is not None:
+            self.watchdog.start()
+        self.bot.send('CAP REQ :multi-prefix')
+
+    def to_state(self):
+        """State of the plugin, keyed by channel name, PLAYERS_KEY or
+        STATS_KEY and the key of the statistics"""
+        state = {name: game.to_state() for name, game in self.games.items()}
+        state[PLAYERS_KEY] = self.players_state()
+        for key, value in self.player_stats.to_state().items():
+            state[STATS_KEY + key] = value
+        state[VERSION_KEY] = STATE_VERSION
+        return state
+
+    def players_state(self):
+        return {nick: player.play_time.to_state()
+                for nick, player in self.players.items()
+                if player.play_time is not None}
+
+    def from_state(self, state):
+        # older layouts are read with defaults for what they lack
+        version = state.get(VERSION_KEY, STATE_VERSION)
+        if version > STATE_VERSION:
+            self.bot.log.warning('ignoring state of version %r', version)
+            return
+        for key, value in state.items():
+            if key == VERSION_KEY:
+                continue
+            if key == PLAYERS_KEY:
+                for nick, play_time in value.items():
+                    play_time = PlayTime.from_state(play_time)
+                    self.player(nick).play_time = play_time
+                    if play_time.deadline is not None:
+                        self.deadlines.schedule(nick, play_time.deadline)
+            elif key.startswith(STATS_KEY):
+                self.player_stats.from_state(key[len(STATS_KEY):], value)
+            else:
+                self.games[key] = Game.from_state(self, key, value)
+
+    def changed(self, key=PLAYERS_KEY):
+        """Have the state of a channel or of the players checkpointed"""
+        if self.checkpoint is None:
+            return
+        self.dirty.add(key)
+        if self.saving is None:
+            delay = float(self.config.get('checkpoint_delay', .5))
+            self.saving = self.bot.loop.call_later(delay, self.save)
+
+    def stats_changed(self, key):
+        self.changed(STATS_KEY + key)
+
+    def save(self):
+        self.saving = None
+        states = {VERSION_KEY: STATE_VERSION}
+        for key in self.dirty:
+            if key == PLAYERS_KEY:
+                states[key] = self.players_state()
+            elif key.startswith(STATS_KEY):
+                states[key] = self.player_stats.to_state(
+                    key[len(STATS_KEY):])
+            elif key in self.games:
+                states[key] = self.games[key].to_state()
+        self.dirty.clear()
+
+        def done(future):
+            if future.exception() is not None:
+                self.bot.log.error('could not checkpoint %r: %r',
+                                   sorted(states), future.exception())
+
+        self.checkpoint.write(states).add_done_callback(done)
+
+    def player(self, nick):
+        """The record of nick, created if needed"""
+        player = self.players.get(nick)
+        if player is None:
+            player = Player(nick)
+            self.players[player.nick] = player
+        return player
+
+    def player_game(self, nick):
+        player = self.players.get(nick)
+        return player.game if player is not None else None
+
+    def play_time(self, nick):
+        player = self.players.get(nick)
+        return player.play_time if player is not None else None
+
+    def forget(self, player):
+        """Drop the record of player if there is nothing left in it"""
+        if (player.game is None and player.play_time is None
+                and self.players.get(player.nick) is player):
+            del self.players[player.nick]
+
+    def release(self, game, nick):
+        """Unlink nick from game if it has nothing left to do in it"""
+        player = self.players.get(nick)
+        if (player is not None and player.game is game
+                and nick not in game.pending_players
+                and nick not in game.player_tables):
+            player.game = None
+            self.forget(player)
+
+    def example(self, piece, gender, plurality, rng=random):
+        """Example fragment for piece, agreeing if gender is known"""
+        key = (piece, gender, plurality)
+        if self.corpus is not None and key in self.corpus:
+            return self.corpus.choice(*key, rng)
+        examples = data.EXAMPLES[piece]
+        if gender is None:
+            return rng.choice(examples)
+        return examples[gender * 2 + plurality]
+
+    def record_in(self, raw, **kw):
+        if self.recorder is not None:
+            self.recorder.line('in', raw)
+
+    def record_out(self, raw, **kw):
+        if self.recorder is not None:
+            self.recorder.line('out', raw)
+
+    def stalled(self, lag, handler, stack):
+        """Warn that the event loop was blocked for lag seconds"""
+        self.bot.log.warning('event loop blocked for %.2fs in %s\n%s', lag,
+                             handler, ''.join(traceback.format_list(stack)))
+        where = handler or '?'
+        if stack:
+            frame = stack[-1]
+            where += (f" ({os.path.basename(frame.filename)}:{frame.lineno} "
+                      f"{frame.name})")
+        msg = f"boucle bloquée pendant {lag:.1f} sec dans {where}"
+        for target in irc3.utils.as_list(self.config.get('watchdog_to', '')):
+            self.output.privmsg(target, msg, CRITICAL)
+
+    def load_stats(self):
+        """Count the archived games in the player statistics"""
+        # counted in the archive thread, then added to what was counted
+        # meanwhile: queued before any new game is archived, so none is
+        # counted twice
+        def done(future):
+            if future.exception() is not None:
+                self.bot.log.error('could not load statistics: %r',
+                                   future.exception())
+            else:
+                self.player_stats.merge(future.result())
+
+        self.archive.delays(Stats().load).add_done_callback(done)
+
+    def archive_game(self, **game):
+        if self.archive is None:
+            return
+
+        def done(future):
+            if future.exception() is not None:
+                self.bot.log.error('could not archive %r: %r',
+                                   game, future.exception())
+
+        self.archive.record(**game).add_done_callback(done)
+
+    def game_for(self, mask, target):
+        """Find the game a command is about"""
+        if target == self.bot.nick:
+            return self.player_game(mask.nick)
+        return self.games.get(target)
+
+    @irc3.event(irc3.rfc.JOIN)
+    @timed
+    def on_join(self, mask, channel, **kw):
+        if mask.nick == self.bot.nick:
+            self.output.hostmask = mask
+            game = self.games.get(channel)
+            if game is None:
+                game = self.games[channel] = Game(self, channel)
+            game.state = State.wait_for_names
+        elif channel in self.games:
+            # no one joins with a voice
+            self.games[channel].on_leave(mask.nick)
+
+    @irc3.event(irc3.rfc.RPL_ENDOFNAMES)
+    @timed
+    def on_endofnames(self, me, channel, **kw):
+        game = self.games.get(channel)
+        if game is not None:
+            game.on_endofnames()
+
+    @irc3.event(irc3.rfc.PART)
+    @timed
+    def on_part(self, mask, channel, data=None, **kw):
+        game = self.games.get(channel)
+        if game is not None:
+            game.handle_part(mask.nick)
+            game.on_leave(mask.nick)
+
+    @irc3.event(irc3.rfc.QUIT)
+    @timed
+    def on_quit(self, mask, data=None, **kw):
+        game = self.player_game(mask.nick)
+        if game is not None:
+            game.handle_part(mask.nick)
+        for game in self.games.values():
+            game.on_leave(mask.nick)
+
+    @irc3.event(irc3.rfc.KICK)
+    @timed
+    def on_kick(self, mask, channel, target, data=None, **kw):
+        game = self.games.get(channel)
+        if game is not None:
+            game.handle_part(target)
+            game.on_leave(target)
+
+    @irc3.event(irc3.rfc.NEW_NICK)
+    @timed
+    def on_nick(self, nick, new_nick, **kw):
+        for game in self.games.values():
+            game.on_rename(nick.nick, new_nick)
+
+    @irc3.event(irc3.rfc.MODE)
+    @timed
+    def on_mode(self, mask, target, modes, data=None, **kw):
+        game = self.games.get(target)
+        if game is None or not data:
+            return
+        noargs = self.bot.server_config['CHANMODES'].split(',')[-1]
+        if not modes.startswith(('+', '-')):
+            modes = '+' + modes
+        changes = irc3.utils.parse_modes(modes, data.split(), noargs)
+        for sign, mode, nick in changes:
+            if mode == 'v' and nick is not None:
+                game.on_voice(sign, nick)
+
+    @irc3.event(irc3.rfc.ERR_CHANOPRIVSNEEDED)
+    @timed
+    def on_chanoprivsneeded(self, channel, **kw):
+        game = self.games.get(channel)
+        if game is not None:
+            game.on_refused()
+
+    @irc3.event(irc3.rfc.PRIVMSG)
+    @timed
+    def on_private_message(self, mask, event, target, data, **kw):
+        if target != self.bot.nick:
+            return
+        game = self.player_game(mask.nick)
+        if game is None:
+            return
+        table = game.player_tables.get(mask.nick)
+        if table is not None:
+            table.on_fragment(mask.nick, data)
+
     @command(permission='admin')
+    @timed
     def kick(self, mask, target, args):
         """Kick player from the queue
 
             %%kick <nick>...
         """
-        kicked = set(args['<nick>'])
-        self.pending_players -= kicked
-        voiced = set(self.channel.modes['+'])
-        self.mode_nick('-v', *(kicked & voiced))
+        game = self.game_for(mask, target)
+        if game is None:
+            return
+        kicked = set(args['<nick>']) & game.pending_players
+        for nick in kicked:
+            game.discard_pending(nick)
+        game.mode_nick('-v', *kicked)
 
     @command(permission='admin')
+    @timed
     def abort(self, mask, target, args):
-        """Abort the game
+        """Finish the running games, making up the missing fragments
 
             %%abort
         """
-        if self.state != State.game:
+        game = self.game_for(mask, target)
+        if game is None:
             return
-        self.say("partie avortée (noraj thizanne)")
-        self.end_game()
+        for table in list(game.tables):
+            if table.state == State.game:
+                table.say("partie écourtée (noraj thizanne)")
+                table.fill_in(sorted(table.missing()))
 
     @command(permission='admin')
+    @timed
     def dump(self, mask, target, args):
         """Dump the internal game state
 
             %%dump
         """
-        for name, val in self.__dict__.items():
-            self.say(f'{name} = {val!r}', to=mask.nick)
+        game = self.game_for(mask, target)
+        say = functools.partial(self.output.privmsg, mask.nick)
+        if game is not None:
+            for name, val in game.__dict__.items():
+                if name not in ('plugin', 'tables'):
+                    say(f'{name} = {val!r}')
+            for table in game.tables:
+                for name, val in table.__dict__.items():
+                    if name != 'game':
+                        say(f'table {table.number}.{name} = {val!r}')
+        play_times = {nick: player.play_time
+                      for nick, player in self.players.items()
+                      if player.play_time is not None}
+        say(f'player_times = {play_times!r}')
+
+    @command(permission='admin')
+    @timed
+    def metrics(self, mask, target, args):
+        """Show the metrics whose name starts with prefix
+
+            %%metrics [<prefix>]
+        """
+        if not REGISTRY.enabled:
+            return "pas de métriques (voir metrics_port)"
+        say = functools.partial(self.output.privmsg, mask.nick)
+        for line in REGISTRY.summary(args['<prefix>'] or ''):
+            say(line)
 
     @command(name='reset', permission='admin')
+    @timed
     def reset_cmd(self, mask, target, args):
         """Reset the game state
 
             %%reset
         """
-        self.reset()
-        self.state = State.queue
+        game = self.game_for(mask, target)
+        if game is None:
+            return
+        game.reset()
+        game.state = State.queue
 
     @command(permission='admin', use_shlex=False, options_first=True)
+    @timed
+    @offloadable
     def exec(self, mask, target, args):
         """Exec python code
 
@@ -247,6 +1203,7 @@ class Cadavre:
             return colors.bold_red('Exception: ') + str(ex)
 
     @command(permission='play', aliases=['play'])
+    @timed
     def join(self, mask, target, args):
         """Join the waiting room for the next game(s).
 
@@ -255,239 +1212,291 @@ class Cadavre:
             <time> can be either the number of games you wish to play or
             a time unit such as '10m' or '1h'.
         """
-        if args['<time>']:
-            self.player_times[mask.nick] = PlayTime(args['<time>'])
-        elif mask.nick in self.player_times:
-            del self.player_times[mask.nick]
-
-        if mask.nick in self.pending_players:
+        game = self.game_for(mask, target)
+        if game is None:
             return
-        if len(self.pending_players) == max(data.MODES):
-            return f"{mask.nick}: nan, y'a déjà trop de joueurs"
+        other = self.player_game(mask.nick)
+        if other is not None and other is not game:
+            return f"{mask.nick}: tu joues déjà sur {other.channel_name}"
 
-        self.pending_players.add(mask.nick)
+        self.changed()
+        if args['<time>']:
+            play_time = PlayTime(args['<time>'])
+            self.player(mask.nick).play_time = play_time
+            if play_time.deadline is not None:
+                self.deadlines.schedule(mask.nick, play_time.deadline)
+            else:
+                self.deadlines.discard(mask.nick)
+        elif self.play_time(mask.nick) is not None:
+            self.players[mask.nick].play_time = None
+            self.deadlines.discard(mask.nick)
 
-        if self.state in State.non_game_states():
-            if mask.nick not in self.channel.modes['+']:
-                self.mode_nick('+v', mask.nick)
-            if len(self.pending_players) == max(data.MODES):
-                self.start_game()
-        elif self.state in State.game_states():
-            # in game, defer +v
-            return f"{mask.nick}: je note pour la prochaine partie"
+        return game.join(mask.nick)
 
     @command(permission='play', aliases=['unplay'])
+    @timed
     def part(self, mask, target, args):
         """Exit from the waiting room
 
             %%part
         """
-        if self.state in State.game_states():
-            if mask.nick in self.pending_players:
-                self.pending_players.remove(mask.nick)
-                return f"{mask.nick}: ok bisous"
-            return
-        self.pending_players.discard(mask.nick)
-        if mask.nick in self.channel.modes['+']:
-            self.mode_nick('-v', mask.nick)
+        game = self.game_for(mask, target)
+        if game is not None:
+            return game.part(mask.nick)
 
     @command(permission='play')
+    @timed
     def start(self, mask, target, args):
-        """Start a game (if enough players have joined)
+        """Start games with everyone waiting (if enough players have joined)
 
             %%start
         """
-        if self.state != State.queue:
+        game = self.game_for(mask, target)
+        if game is None or game.state != State.queue:
             return
-        if mask.nick not in self.pending_players:
+        if mask.nick not in game.pending_players:
             return
-        if len(self.pending_players) < min(data.MODES):
+        if mask.nick in game.player_tables:
+            return
+        if len(game.idle_players()) < min(data.MODES):
             return "nan, il manque des joueurs"
-        self.start_game()
+        game.matchmake(everyone=True)
 
     @command(permission='play')
+    @timed
     def blame(self, mask, target, args):
         """Blame players that have not answered yet
 
             %%blame
         """
-        if self.state != State.game:
+        game = self.game_for(mask, target)
+        if game is None:
             return
 
         nick = mask.nick
-        if nick in self.blame_users:
-            return
-        self.blame_users.add(nick)
+        table = game.player_tables.get(nick)
+        tables = [table] if table is not None else game.tables
+        for table in tables:
+            if table.state != State.game or nick in table.blame_users:
+                continue
+            table.blame_users.add(nick)
 
-        missing = set(nick for nick, piece in self.player_pieces.items()
-                      if piece not in self.pieces)
-        if not missing:
-            return
+            missing = sorted(table.missing())
+            if not missing:
+                continue
+            for player in missing:
+                self.player_stats.blamed(player)
 
-        delay = time.monotonic() - self.start_time
-        msg = f"après {delay:.1f} sec on attend toujours {', '.join(missing)}"
-        # invoked by a player that did not answer (such troll lol)
-        if nick in missing:
-            msg += f" (oui, surtout toi, con de {nick})"
-        self.say(msg)
+            delay = time.monotonic() - table.start_time
+            msg = (f"après {delay:.1f} sec on attend toujours "
+                   f"{', '.join(missing)}")
+            # invoked by a player that did not answer (such troll lol)
+            if nick in missing:
+                msg += f" (oui, surtout toi, con de {nick})"
+            table.say(msg)
 
     @command(permission='play')
+    @timed
     def sub(self, mask, target, args):
         """Subscribe to %%summon notifications
 
             %%sub
 
         """
-        if mask.nick not in self.subscribed_players:
-            self.subscribed_players.add(mask.nick)
+        game = self.game_for(mask, target)
+        if game is not None:
+            game.subscribed_players.add(sys.intern(mask.nick))
+            game.changed()
 
     @command(permission='play')
+    @timed
     def unsub(self, mask, target, args):
         """Unsubscribe to %%summon notifications
 
             %%unsub
 
         """
-        if mask.nick in self.subscribed_players:
-            self.subscribed_players.remove(mask.nick)
+        game = self.game_for(mask, target)
+        if game is not None:
+            game.subscribed_players.discard(mask.nick)
+            game.changed()
 
     @command(permission='play')
+    @timed
     def summon(self, mask, target, args):
         """Summon players that have used %%sub
 
             %%summon
         """
-        nicks = self.subscribed_players - {mask.nick}
+        game = self.game_for(mask, target)
+        if game is None:
+            return
+        nicks = game.subscribed_players - {mask.nick}
         if not nicks:
             return
 
-        return f"allô {', '.join(nicks)}, on joue ?"
+        game.say(f"allô {', '.join(nicks)}, on joue ?")
 
     @command(permission='play')
-    def reveal(self, mask, target, args):
-        """Reveal last sentence piece boundaries
+    @timed
+    async def reveal(self, mask, target, args):
+        """Reveal piece boundaries of the last or of an archived sentence
 
-            %%reveal
+            %%reveal [<id>]
         """
-        if not self.last_game:
+        game = self.game_for(mask, target)
+        if game is None:
+            return
+
+        if args['<id>']:
+            if self.archive is None or not args['<id>'].isdigit():
+                return "je n'ai rien dans le sac"
+            record = await self.archive.get(game.channel_name,
+                                            int(args['<id>']))
+            if record is None:
+                return "je n'ai rien dans le sac"
+            players, parts = record.players, record.parts
+            intro = f"phrase #{record.id} par {', '.join(players)}:"
+        elif game.last_game:
+            players, parts = game.last_game
+            intro = f"dernière phrase par {', '.join(players)}:"
+        else:
             return "je n'ai rien dans le sac"
 
-        players, parts = self.last_game
         sentence = data.assemble_sentence(
             parts, colors.underline, colors.underline)
-        self.say(f"dernière phrase par {', '.join(players)}:")
-        self.say(f"\N{WHITE RIGHT-POINTING TRIANGLE} {sentence}")
-
-    @cron('* * * * *')
-    def check_times(self):
-        for player, play_time in self.player_times.items():
-            if not play_time.check_time():
-                self.part(IrcString(player), None, {})
-
-    def start_game(self):
-        self.ensure_state(State.queue)
-
-        subject_gender = random.choice(TRUE_FALSE)
-        object_gender = random.choice(TRUE_FALSE)
-        subject_plurality = random.choice(TRUE_FALSE)
-        object_plurality = random.choice(TRUE_FALSE)
-
-        def gender_name(ge):
-            return "masculin" if ge else "féminin"
-
-        def plurality_name(nb):
-            return "singulier" if nb else "pluriel"
-
-        def example_idx(gender, plurality):
-            return gender * 2 + plurality
-
-        self.players = list(self.pending_players)
-        random.shuffle(self.players)
-
-        messages = []
-        fragments = []
-        for player, piece in zip(self.players, data.MODES[len(self.players)]):
-            self.player_pieces[player] = piece
-
-            examples = data.EXAMPLES[piece]
-
-            if piece == 'Cc':
-                gender = None
-                plurality = None
-                example = random.choice(examples)
-            else:
-                subject = piece in data.SUBJECT_PIECES
-                gender = subject_gender if subject else object_gender
-                plurality = subject_plurality if subject else object_plurality
-                example = examples[example_idx(gender, plurality)]
-
-            tune = ''
-            if piece == 'V':
-                tune = (f" conjugué au {gender_name(gender)} à la 3è personne "
-                        f"du {plurality_name(plurality)}")
-            elif piece != 'Cc':
-                tune = (f" accordé au {gender_name(gender)} "
-                        f"{plurality_name(plurality)}")
-
-            msg = (f"donne-moi un {data.PIECES[piece]}{tune} "
-                   f"convenant à cette phrase: ")
-
-            fragments.append(example)
-            messages.append(msg)
+        game.say(intro)
+        game.say(f"\N{WHITE RIGHT-POINTING TRIANGLE} {sentence}")
 
-        for i, (player, msg) in enumerate(zip(self.players, messages)):
-            def highlight_part(phrase, index):
-                phrase = phrase[:]
-                phrase[index] = colors.bold_green(phrase[index])
-                return ' '.join(phrase)
+    @command(permission='view')
+    @timed
+    def pace(self, mask, target, args):
+        """Show how fast games are going in this channel
 
-            msg += highlight_part(fragments, i)
-            self.say(msg, to=player)
-
-        people = ", ".join(self.pending_players)
-        msg = f"{people}: c'est parti, lisez vos PV pour savoir quoi m'envoyer"
-        self.start_time = time.monotonic()
-        self.say(msg)
-        self.state = State.game
+            %%pace
+        """
+        game = self.game_for(mask, target)
+        if game is None:
+            return
+        pacing = game.pacing
+        msg = f"{pacing.games_per_hour()} parties dans la dernière heure"
+        if pacing.response_time is not None:
+            msg += f", réponses en {pacing.response_time:.1f} sec"
+        if pacing.games:
+            msg += f", {pacing.pause_per_game():.1f} sec de pause par partie"
+        return msg
+
+    @command(permission='view')
+    @timed
+    def stats(self, mask, target, args):
+        """Show the statistics of a player, or the response times of a
+        piece (S, V, C, …)
+
+            %%stats [<nick>]
+        """
+        nick = args['<nick>'] or mask.nick
+        stats = self.player_stats.get(nick)
+        if stats is None and nick in data.PIECES:
+            return self.piece_stats(nick)
+        if stats is None:
+            return f"connais pas {nick}"
+        msg = (f"{stats.nick}: {stats.games} parties, "
+               f"{stats.aborts} abandons, relancé {stats.blames} fois")
+        if stats.delays.count:
+            median = stats.delays.quantile(.5)
+            slow = stats.delays.quantile(.9)
+            msg += (f", répond en {median:.1f} sec "
+                    f"(et plus de {slow:.1f} sec 1 fois sur 10)")
+        return msg
+
+    def piece_stats(self, piece):
+        sketch = self.player_stats.pieces.get(piece)
+        name = data.PIECES[piece]
+        if sketch is None:
+            return f"pas encore de {name}"
+        median = sketch.quantile(.5)
+        slow = sketch.quantile(.9)
+        return (f"{name}: {sketch.count} réponses, en {median:.1f} sec "
+                f"(et plus de {slow:.1f} sec 1 fois sur 10)")
+
+    @command(permission='view')
+    @timed
+    def top(self, mask, target, args):
+        """Show the fastest players
+
+            %%top
+        """
+        ranked = self.player_stats.top(5)
+        if not ranked:
+            return "pas encore assez de parties"
+        return "les plus rapides: " + ", ".join(
+            f"{stats.nick} ({median:.1f} sec)" for median, stats in ranked)
 
-    def enter_grace_period(self):
-        self.ensure_state(State.game)
-        self.state = State.game_grace_period
-        self.bot.loop.call_later(4, self.announce_game_end)
+    @command(permission='play')
+    @timed
+    async def history(self, mask, target, args):
+        """Show the last sentences played in this channel
 
-    def announce_game_end(self):
-        self.ensure_state(State.game_grace_period)
-        parts = [self.pieces[piece] for piece in data.MODES[len(self.pieces)]]
-        self.last_game = (list(self.players), list(parts))
-        self.say(f"merci à {', '.join(self.players)}:")
-        sentence = data.assemble_sentence(parts)
-        self.say(f"\N{WHITE RIGHT-POINTING TRIANGLE} {sentence}")
-        self.end_game()
+            %%history [<n>]
+        """
+        game = self.game_for(mask, target)
+        if game is None or self.archive is None:
+            return
 
-    def end_game(self):
-        self.ensure_state(*State.game_states())
+        count = args['<n>']
+        count = min(int(count), 20) if count and count.isdigit() else 5
+        records = await self.archive.history(game.channel_name, count)
+        return self.show_records(game, mask.nick, reversed(records))
 
-        for player in set(self.players):
-            play_time = self.player_times.get(player)
-            if play_time:
-                play_time.count_game()
+    @command(permission='play')
+    @timed
+    async def search(self, mask, target, args):
+        """Find archived sentences of this channel containing some words
 
-        self.check_times()
-        self.state = State.post_game_cooldown
+            %%search <words>...
+        """
+        game = self.game_for(mask, target)
+        if game is None or self.archive is None:
+            return
 
-        # voice deferred pending, unvoice deferred leaving
-        voiced = set(self.channel.modes['+'])
-        self.mode_nick('+v', *(self.pending_players - voiced))
-        self.mode_nick('-v', *(voiced - self.pending_players))
+        records = await self.archive.search(
+            game.channel_name, ' '.join(args['<words>']), 5)
+        return self.show_records(game, mask.nick, records)
 
-        players = self.pending_players.copy()
-        self.reset()
-        self.pending_players = players
+    @command(permission='play')
+    @timed
+    async def by(self, mask, target, args):
+        """Show the last archived sentences of a player in this channel
 
-        self.bot.loop.call_later(6, self.waiting_room)
+            %%by <nick>
+        """
+        game = self.game_for(mask, target)
+        if game is None or self.archive is None:
+            return
 
-    def waiting_room(self):
-        self.ensure_state(State.post_game_cooldown)
-        self.state = State.queue
-        self.say("on rejoue ?")
+        records = await self.archive.by_player(
+            game.channel_name, args['<nick>'], 5)
+        return self.show_records(game, mask.nick, records)
+
+    def show_records(self, game, nick, records):
+        found = False
+        for record in records:
+            found = True
+            when = time.strftime('%d/%m %H:%M', time.localtime(record.time))
+            sentence = data.assemble_sentence(record.parts)
+            game.say(f"#{record.id} {when} par {', '.join(record.players)}: "
+                     f"{sentence}", to=nick)
+        if not found:
+            return "je n'ai rien dans le sac"
 
+    def expire(self, nick):
+        """Make nick leave the waiting room once their play time is over"""
+        self.deadlines.discard(nick)
+        self.changed()
+        player = self.players.get(nick)
+        if player is None:
+            return
+        player.play_time = None
+        if player.game is not None:
+            player.game.part(nick)
+        self.forget(player)
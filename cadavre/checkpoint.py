@@ -0,0 +1,108 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['Checkpoint']
+
+
+class Checkpoint:
+    """Crash-safe storage of the game state.
+
+    The state is split in keys (one per channel, plus the players) whose
+    latest value is appended to a journal as soon as it changes. Once the
+    journal gets long, it's compacted into a snapshot holding only the
+    latest value of each key. On load, the journal is replayed on top of
+    the snapshot; a torn last line (crash while writing) is cut off.
+    States are serialized on the caller's thread, the writes happen in a
+    dedicated thread.
+    """
+
+    def __init__(self, path, loop, compact_after=1000):
+        self.path = path
+        self.journal_path = path + '.wal'
+        self.loop = loop
+        self.compact_after = compact_after
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # key -> serialized state, only touched by the writer thread once
+        # loaded
+        self.latest = {}
+        self.records = 0
+
+    def load(self):
+        """Latest state of each key, read synchronously at startup"""
+        latest = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                latest.update(json.load(f))
+        except FileNotFoundError:
+            pass
+
+        records = 0
+        try:
+            with open(self.journal_path, 'rb') as f:
+                good = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('torn line')
+                        key, state = json.loads(line)
+                    except ValueError:
+                        break
+                    latest[key] = state
+                    records += 1
+                    good += len(line)
+                torn = f.seek(0, os.SEEK_END) > good
+            if torn:
+                # the next lines are appended after the last whole one
+                os.truncate(self.journal_path, good)
+        except FileNotFoundError:
+            pass
+
+        for key in [key for key, state in latest.items() if state is None]:
+            del latest[key]
+        self.latest = {key: self.dumps(state)
+                       for key, state in latest.items()}
+        self.records = records
+        return latest
+
+    @staticmethod
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    def write(self, states):
+        """Journal the new state of some keys, None deletes a key"""
+        # serialized right away: the states go on changing once this returns
+        states = {key: self.dumps(state) for key, state in states.items()}
+        lines = ''.join(f'[{self.dumps(key)}, {state}]\n'
+                        for key, state in states.items())
+        return self.loop.run_in_executor(
+            self.executor, self.append, states, lines)
+
+    def append(self, states, lines):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        for key, state in states.items():
+            if state == 'null':
+                self.latest.pop(key, None)
+            else:
+                self.latest[key] = state
+        self.records += len(states)
+        if self.records >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('{' + ', '.join(f'{self.dumps(key)}: {state}'
+                                    for key, state in self.latest.items())
+                    + '}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # replaying the journal over the new snapshot would be harmless, so
+        # a crash before this truncation is fine
+        open(self.journal_path, 'w').close()
+        self.records = 0
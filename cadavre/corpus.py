@@ -0,0 +1,119 @@
+"""Memory-mapped corpus of example fragments.
+
+The corpus file holds fragments grouped by (piece, gender, plurality) so that
+a random fragment of a group can be read in constant time without loading
+the file, which is shared between processes through the page cache.
+
+Layout (little-endian):
+    header      magic, version, number of groups
+    groups      piece index, gender, plurality, first fragment, count
+    offsets     fragment count + 1 offsets into the text
+    text        UTF-8 fragments, back to back
+
+Build one from a tab-separated file with lines of the form
+"piece<TAB>gender<TAB>plurality<TAB>fragment", where gender is m, f or -
+and plurality is s, p or -:
+
+    python -m cadavre.corpus fragments.tsv corpus.bin
+"""
+import sys
+import mmap
+import random
+import struct
+
+from . import data
+
+__all__ = ['Corpus', 'build']
+
+MAGIC = b'CADC'
+VERSION = 1
+
+HEADER = struct.Struct('<4sII')
+GROUP = struct.Struct('<BBBxQQ')
+OFFSETS = struct.Struct('<QQ')
+OFFSET = struct.Struct('<Q')
+
+PIECES = list(data.PIECES)
+# gender and plurality are True, False or None (for 'Cc')
+FLAGS = {False: 0, True: 1, None: 2}
+FLAG_VALUES = {value: flag for flag, value in FLAGS.items()}
+FLAG_NAMES = {'m': True, 'f': False, 's': True, 'p': False, '-': None}
+
+
+class Corpus:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a corpus file')
+
+        self.groups = {}
+        total = 0
+        for i in range(count):
+            piece, gender, plurality, start, size = GROUP.unpack_from(
+                self.map, HEADER.size + i * GROUP.size)
+            key = (PIECES[piece], FLAG_VALUES[gender], FLAG_VALUES[plurality])
+            self.groups[key] = (start, size)
+            total += size
+
+        self.offsets = HEADER.size + count * GROUP.size
+        self.text = self.offsets + (total + 1) * OFFSET.size
+
+    def __contains__(self, key):
+        return key in self.groups
+
+    def __len__(self):
+        return sum(size for start, size in self.groups.values())
+
+    def choice(self, piece, gender, plurality, rng=random):
+        """Random fragment of a group, KeyError if there's none"""
+        start, size = self.groups[(piece, gender, plurality)]
+        index = start + rng.randrange(size)
+        begin, end = OFFSETS.unpack_from(
+            self.map, self.offsets + index * OFFSET.size)
+        return self.map[self.text + begin:self.text + end].decode()
+
+
+def build(fragments, path):
+    """Write the (piece, gender, plurality, fragment) tuples to path"""
+    groups = {}
+    for piece, gender, plurality, fragment in fragments:
+        groups.setdefault((piece, gender, plurality), []).append(
+            fragment.encode())
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(groups)))
+        start = 0
+        for (piece, gender, plurality), texts in groups.items():
+            f.write(GROUP.pack(PIECES.index(piece), FLAGS[gender],
+                               FLAGS[plurality], start, len(texts)))
+            start += len(texts)
+
+        offset = 0
+        f.write(OFFSET.pack(offset))
+        for texts in groups.values():
+            for text in texts:
+                offset += len(text)
+                f.write(OFFSET.pack(offset))
+
+        for texts in groups.values():
+            f.writelines(texts)
+
+
+def read_tsv(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            piece, gender, plurality, fragment = line.split('\t', 3)
+            yield (piece, FLAG_NAMES[gender], FLAG_NAMES[plurality],
+                   fragment.strip())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(f'usage: {sys.argv[0]} <fragments.tsv> <corpus.bin>')
+    build(read_tsv(sys.argv[1]), sys.argv[2])
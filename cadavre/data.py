@@ -1,5 +1,7 @@
 import string
 
+from .metrics import timed
+
 PIECES = {
     'S': "sujet",
     'Se': "attribut du sujet",
@@ -27,6 +29,29 @@ MODES = {
     6: ['S', 'Se', 'V', 'C', 'Ce', 'Cc'],
 }
 
+
+def table_sizes(count):
+    """
+    Split count waiting players into as few tables as possible.
+
+    >>> table_sizes(2)
+    []
+    >>> table_sizes(5)
+    [5]
+    >>> table_sizes(7)
+    [4, 3]
+    >>> table_sizes(12)
+    [6, 6]
+    >>> table_sizes(13)
+    [5, 4, 4]
+    """
+    if count < min(MODES):
+        return []
+    tables = -(-count // max(MODES))
+    size, extra = divmod(count, tables)
+    return [size + 1] * extra + [size] * (tables - extra)
+
+
 LIGATURES = {
     ("à", "le"): "au",
     ("à", "les"): "aux",
@@ -38,6 +63,26 @@ LIGATURES = {
 }
 
 
+def compile_ligatures(ligatures):
+    """
+    Index ligatures by the word ending the left part, then by the word
+    starting the right part.
+
+    >>> compile_ligatures({("à", "le"): "au", ("à", "les"): "aux"})
+    {'à': {'le': 'au', 'les': 'aux'}}
+    """
+    rules = {}
+    for (left, right), replace in ligatures.items():
+        rules.setdefault(left, {})[right] = replace
+    return rules
+
+
+LIGATURE_RULES = compile_ligatures(LIGATURES)
+
+VOWELS = frozenset("aeiou")
+
+
+@timed
 def assemble_sentence(parts, mark_begin='', mark_end=''):
     """
     Assemble parts and try to keep it French.
@@ -82,42 +127,67 @@ def assemble_sentence(parts, mark_begin='', mark_end=''):
     "[Meuf] [qu'Aristote démonte]."
     >>> assemble_sentence(['meuf que', 'Ursule encule'], '[', ']')
     "[Meuf] [qu'Ursule encule]."
+
+    A part of a single word takes part in the rules too, unless it opens
+    the sentence:
+
+    >>> assemble_sentence(['une', 'que', 'elle nique'])
+    "Une qu'elle nique."
+    >>> assemble_sentence(['une', 'de', 'le voisin'], '[', ']')
+    '[Une] [du voisin].'
+    >>> assemble_sentence(['meuf,', ', à', 'les voisins'])
+    'Meuf, aux voisins.'
+    >>> assemble_sentence(['que', 'elle nique'])
+    'Que elle nique.'
     """
-    result = ""
-    mb = mark_begin
-    me = mark_end
-
-    def ligature(part):
-        nonlocal result
-        for (left, right), replace in LIGATURES.items():
-            if (result.rstrip(me).lower().endswith(" " + left) and
-                    part.lower().startswith(right + " ")):
-                result = " ".join((
-                    result.rstrip(me)[:-len(left) - 1] + me,
-                    mb + replace,
-                    part[len(right) + 1:] + me))
-                return True
-            if (result.rstrip(me).lower().endswith(" que")
-                    and part[0].lower() in "aeiou"):
-                result = (result.rstrip(string.whitespace + me)[:-4] + me +
-                          " " + mb + "qu'" + part + me)
-                return True
-        return False
-
-    for i, part in enumerate(parts):
+    # each token is a (separator, text) pair, text being wrapped in marks
+    tokens = []
+
+    for part in parts:
         part = part.strip()
         if part.endswith(","):
             part = part.rstrip(string.whitespace + ",") + ","
-        if i == 0:
-            result += mb + part[0].upper() + part[1:] + me
-        elif result.rstrip(me).endswith(",") and part.startswith(","):
-            result = (result.rstrip(me + ",") + me + ", " +
-                      mb + part.lstrip(string.whitespace + ",") + me)
-        elif ligature(part):
+
+        if not tokens:
+            tokens.append(("", part[:1].upper() + part[1:]))
+            continue
+
+        sep, prev = tokens[-1]
+        if part.startswith(","):
+            part = part.lstrip(string.whitespace + ",")
+            if prev.endswith(","):
+                prev = prev.rstrip(",")
+                tokens[-1] = (sep, prev)
+            tokens.append((", ", part))
             continue
-        elif not part.startswith(","):
-            result += " " + mb + part + me
+
+        # the last word of the sentence so far, which the first word of
+        # part may merge with
+        head, space, last = prev.rpartition(" ")
+        last = last.lower() if space or len(tokens) > 1 else None
+        merged = None
+        if last == "que" and part[:1].lower() in VOWELS:
+            merged = "qu'" + part
         else:
-            result += ", " + mb + part.lstrip(string.whitespace + ",") + me
+            rules = LIGATURE_RULES.get(last)
+            if rules:
+                right, space, rest = part.partition(" ")
+                replace = rules.get(right.lower()) if space else None
+                if replace:
+                    merged = replace + " " + rest
+        if merged is not None:
+            if head:
+                tokens[-1] = (sep, head)
+                tokens.append((" ", merged))
+            else:
+                # the whole previous part merged
+                tokens[-1] = (sep, merged)
+            continue
+
+        tokens.append((" ", part))
 
-    return result + "."
+    result = []
+    for sep, text in tokens:
+        result.extend((sep, mark_begin, text, mark_end))
+    result.append(".")
+    return "".join(result)
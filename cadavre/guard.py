@@ -1,9 +1,112 @@
+import re
+import copy
+import fnmatch
+import collections
 
+import irc3
 from irc3.plugins.command import mask_based_policy
 
+# permission granting all the others
+ALL = 'all_permissions'
+
+
+def compile_masks(masks):
+    """
+    Compile the masks into one regex per permission, matching the hostmasks
+    that have it.
+
+    >>> matchers = compile_masks({'*!*@admin': ALL, '*': 'help, view'})
+    >>> sorted(matchers)
+    ['all_permissions', 'help', 'view']
+    >>> bool(matchers['view'].match('toto!t@admin'))
+    True
+    >>> bool(matchers[ALL].match('toto!t@host'))
+    False
+    """
+    if not isinstance(masks, dict):
+        masks = dict.fromkeys(masks, ALL)
+    patterns = collections.defaultdict(list)
+    for pattern, permissions in masks.items():
+        for permission in re.split(r'[\s,]+', str(permissions).strip()):
+            if permission:
+                patterns[permission].append(fnmatch.translate(pattern))
+    return {permission: re.compile('|'.join(regexes))
+            for permission, regexes in patterns.items()}
+
 
 class policy(mask_based_policy):
+    """Check permissions against masks compiled once, caching the
+    permissions of each user until they change nick or quit.
+
+    The masks are compiled again when the configuration is reloaded or when
+    the ones irc3 stores at runtime change."""
     key = __name__ + '.masks'
+    cache_size = 1024
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.events = (
+            irc3.event(irc3.rfc.NEW_NICK, self.on_nick),
+            irc3.event(irc3.rfc.QUIT, self.on_quit),
+        )
+        self.compiled = (None, None)
+        self.cache = collections.OrderedDict()
+        # notified like the plugins, to attach its events again when a
+        # reload drops them
+        bot.registry.plugins[f'{__name__}.{type(self).__name__}'] = self
+        self.after_reload()
+
+    def after_reload(self):
+        self.context.detach_events(*self.events)
+        self.context.attach_events(*self.events)
+
+    def stored(self):
+        """The masks stored at runtime, merged into the configured ones"""
+        if hasattr(self.context, 'db'):
+            try:
+                return self.context.db[self]
+            except KeyError:
+                pass
+        return None
+
+    def reset(self, config, stored):
+        """Compile the masks and forget the cached permissions"""
+        self.compiled = (config, copy.deepcopy(stored))
+        self.matchers = compile_masks(self.masks)
+        self.cache.clear()
+
+    def permissions(self, mask):
+        """The set of permissions of the hostmask"""
+        # a reloaded configuration is a new object, the stored masks are
+        # few enough to be compared
+        config = self.context.config[self.key]
+        stored = self.stored()
+        if config is not self.compiled[0] or stored != self.compiled[1]:
+            self.reset(config, stored)
+        nick = mask.nick
+        cached = self.cache.get(nick)
+        if cached is not None and cached[0] == mask:
+            self.cache.move_to_end(nick)
+            return cached[1]
+        permissions = frozenset(
+            permission for permission, matcher in self.matchers.items()
+            if matcher.match(mask))
+        self.cache[nick] = (str(mask), permissions)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return permissions
+
+    def has_permission(self, mask, permission):
+        if permission is None:
+            return True
+        permissions = self.permissions(mask)
+        return permission in permissions or ALL in permissions
+
+    def on_nick(self, nick, new_nick, **kw):
+        self.cache.pop(nick.nick, None)
+
+    def on_quit(self, mask, data=None, **kw):
+        self.cache.pop(mask.nick, None)
 
     def __call__(self, predicates, meth, client, target, args, **kwargs):
         permission = predicates.get('permission')
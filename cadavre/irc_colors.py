@@ -56,6 +56,11 @@ class IRCColors:
 
     TOGGLES = ('bold', 'italic', 'underline', 'reverse')
 
+    # colors with their optional numbers, or any other control code
+    STRIP_RE = re.compile(COLOR_RE.pattern + '|[' + ''.join(
+        code for code in CONTROL_CODES.values() if code != '\x03') + ']',
+        re.ASCII)
+
     class Tag(str):
         def __new__(cls, start, end):
             return str.__new__(cls, start)
@@ -70,7 +75,20 @@ class IRCColors:
         if tags.startswith('_'):
             raise AttributeError(tags)
 
-        cur_tags = tags.lower().replace('_', '')
+        name = tags.lower().replace('_', '')
+        tag = self.__dict__.get(name)
+        if tag is None:
+            tag = self.parse(name)
+            if tag is None:
+                raise AttributeError(tags)
+            self.__dict__[name] = tag
+
+        # later lookups of the same spelling won't go through __getattr__
+        setattr(self, tags, tag)
+        return tag
+
+    def parse(self, cur_tags):
+        """Build the Tag for a lowercase name, None if it's not valid"""
         attrs = ''
         colors = []
 
@@ -90,8 +108,7 @@ class IRCColors:
                     break
 
         if cur_tags:
-            print(cur_tags)
-            raise AttributeError(tags)
+            return None
 
         end = attrs
         for name, code in self.CONTROL_CODES.items():
@@ -108,11 +125,23 @@ class IRCColors:
 
         return self.Tag(attrs, end)
 
+    def precompute(self):
+        """Build every control x foreground x background tag up front"""
+        colors = [''] + list(self.COLOR_NAMES)
+        for control in [''] + list(self.CONTROL_CODES):
+            for fg in colors:
+                for bg in colors if fg else ['']:
+                    name = control + fg + bg
+                    if name and name not in self.__dict__:
+                        tag = self.parse(name)
+                        if tag is not None:
+                            self.__dict__[name] = tag
+
     def strip(self, text):
-        text = self.COLOR_RE.sub('', text)
-        for code in self.CONTROL_CODES.values():
-            text = text.replace(code, '')
-        return text
+        # control codes are not printable, so plain text is returned as is
+        if text.isprintable():
+            return text
+        return self.STRIP_RE.sub('', text)
 
 
 IRCColors = IRCColors()
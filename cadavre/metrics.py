@@ -0,0 +1,232 @@
+"""Counters, gauges and latency histograms of the bot.
+
+Nothing is measured until the registry is enabled, so that instrumented
+code only pays for an attribute lookup. Metrics can then be read from the
+!metrics command or scraped in the Prometheus text format from a local
+HTTP endpoint.
+"""
+import time
+import bisect
+import asyncio
+import functools
+
+__all__ = ['Registry', 'REGISTRY', 'timed', 'call', 'HANDLER_SECONDS']
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25,
+           .5, 1, 2.5, 5, 10, 30, 60, 300)
+
+HANDLER_SECONDS = 'cadavre_handler_seconds'
+HANDLER_ERRORS = 'cadavre_handler_errors_total'
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+def format_labels(labels, **extra):
+    labels = labels + tuple(extra.items())
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{escape(value)}"'
+                             for name, value in labels)
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+        # name -> callable giving (labels, value) pairs when read
+        self.gauges = {}
+        self.server = None
+        # handler running on the event loop, read by the watchdog thread
+        self.current = None
+
+    def describe(self, name, kind, help):
+        self.help[name] = (kind, help)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, read, help=''):
+        """Have read() give the (labels, value) pairs of name when needed"""
+        self.gauges[name] = read
+        self.describe(name, 'gauge', help)
+
+    def samples(self):
+        """(name, kind, labels, value) of everything, sorted by name"""
+        samples = []
+        for (name, labels), value in self.counters.items():
+            samples.append((name, 'counter', labels, value))
+        for (name, labels), histogram in self.histograms.items():
+            samples.append((name, 'histogram', labels, histogram))
+        for name, read in self.gauges.items():
+            for labels, value in read():
+                samples.append((name, 'gauge',
+                                tuple(sorted(labels.items())), value))
+        samples.sort(key=lambda sample: sample[:3:2])
+        return samples
+
+    def render(self):
+        """All the metrics in the Prometheus text format"""
+        lines = []
+        last = None
+        for name, kind, labels, value in self.samples():
+            if name != last:
+                help = self.help.get(name, (kind, ''))[1]
+                if help:
+                    lines.append(f'# HELP {name} {escape(help)}')
+                lines.append(f'# TYPE {name} {kind}')
+                last = name
+            if kind != 'histogram':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, le=bound)}'
+                             f' {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value.sum}')
+            lines.append(f'{name}_count{format_labels(labels)} {value.count}')
+        return ''.join(line + '\n' for line in lines)
+
+    def summary(self, prefix=''):
+        """One short line per metric whose name starts with prefix"""
+        for name, kind, labels, value in self.samples():
+            if not name.startswith(prefix):
+                continue
+            name += format_labels(labels)
+            if kind == 'histogram':
+                mean = value.sum / value.count * 1000
+                yield f'{name} count={value.count} mean={mean:.2f}ms'
+            else:
+                yield f'{name} = {value}'
+
+    # HTTP endpoint
+
+    async def serve(self, port, host='127.0.0.1'):
+        """Serve the metrics over HTTP, once per process"""
+        if self.server is not None:
+            return
+        self.server = await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+        try:
+            # whatever the request, the answer is the same
+            await reader.readuntil(b'\r\n\r\n')
+            body = self.render().encode()
+            writer.write(b'HTTP/1.0 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: %d\r\n\r\n' % len(body) + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+REGISTRY = Registry()
+REGISTRY.describe(HANDLER_SECONDS, 'histogram',
+                  'Time spent in event handlers and commands')
+REGISTRY.describe(HANDLER_ERRORS, 'counter',
+                  'Exceptions raised by event handlers and commands')
+
+
+def call(handler, func, *args, **kwargs):
+    """Call func, measuring it and the coroutine it returns as handler"""
+    if not REGISTRY.enabled:
+        return func(*args, **kwargs)
+    start = time.perf_counter()
+    previous, REGISTRY.current = REGISTRY.current, handler
+    try:
+        result = func(*args, **kwargs)
+    except Exception:
+        REGISTRY.inc(HANDLER_ERRORS, handler=handler)
+        raise
+    finally:
+        REGISTRY.current = previous
+    if asyncio.iscoroutine(result):
+        return finish(handler, start, result)
+    REGISTRY.observe(HANDLER_SECONDS, time.perf_counter() - start,
+                     handler=handler)
+    return result
+
+
+class Running:
+    """Await coroutine, marking handler as current while it runs"""
+
+    def __init__(self, handler, coroutine):
+        self.handler = handler
+        self.coroutine = coroutine
+
+    def __await__(self):
+        value = error = None
+        while True:
+            previous, REGISTRY.current = REGISTRY.current, self.handler
+            try:
+                if error is None:
+                    future = self.coroutine.send(value)
+                else:
+                    future = self.coroutine.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                REGISTRY.current = previous
+            try:
+                value, error = (yield future), None
+            except BaseException as exception:
+                value, error = None, exception
+
+
+async def finish(handler, start, coroutine):
+    try:
+        return await Running(handler, coroutine)
+    except Exception:
+        REGISTRY.inc(HANDLER_ERRORS, handler=handler)
+        raise
+    finally:
+        REGISTRY.observe(HANDLER_SECONDS, time.perf_counter() - start,
+                         handler=handler)
+
+
+def timed(func):
+    """Measure the calls of func in HANDLER_SECONDS"""
+    handler = func.__qualname__
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await call(handler, func, *args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return call(handler, func, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,354 @@
+import re
+import itertools
+import collections
+
+from .metrics import REGISTRY
+
+__all__ = ['Output', 'pack_words', 'CRITICAL', 'NORMAL', 'COSMETIC',
+           'PRIORITY_NAMES']
+
+# line priorities, lowest goes out first
+CRITICAL = 0
+NORMAL = 1
+COSMETIC = 2
+PRIORITY_NAMES = ('critical', 'normal', 'cosmetic')
+
+REGISTRY.describe('cadavre_output_wait_seconds', 'histogram',
+                  'Time lines wait for the flood control')
+
+# what can't be cut in half: a color code with its numbers, or a character
+ATOM_RE = re.compile(r'\x03\d{0,2}(?:,\d{1,2})?|.', re.ASCII | re.DOTALL)
+
+# worst case for the nick!user@host prefix until we've seen our own
+USER_HOST_LENGTH = 1 + 10 + 1 + 63
+
+# commands whose first parameter is the target(s) of the line
+TARGETED = frozenset(('PRIVMSG', 'NOTICE', 'MODE', 'KICK', 'TOPIC'))
+
+
+def pack_words(text, limit):
+    """
+    Split text in as few lines of at most limit UTF-8 bytes as possible.
+
+    Lines are cut between words, words longer than a line are cut between
+    characters but never inside a color code.
+
+    >>> pack_words("allô toto, titi, tata, on joue ?", 16)
+    ['allô toto,', 'titi, tata, on', 'joue ?']
+    >>> pack_words("aaaaaaaa", 3)
+    ['aaa', 'aaa', 'aa']
+    >>> pack_words("a \\x0303,04bb", 5)
+    ['a', '\\x0303,04', 'bb']
+    """
+    if text and len(text.encode()) <= limit:
+        return [text]
+    lines = []
+    line = None
+    for word in text.split(' '):
+        if line is not None:
+            joined = line + ' ' + word
+            if len(joined.encode()) <= limit:
+                line = joined
+                continue
+            lines.append(line)
+        line = ''
+        size = 0
+        for atom in ATOM_RE.findall(word):
+            atom_size = len(atom.encode())
+            if line and size + atom_size > limit:
+                lines.append(line)
+                line = ''
+                size = 0
+            line += atom
+            size += atom_size
+    if line:
+        lines.append(line)
+    return lines
+
+
+def line_targets(line):
+    """
+    The targets of a raw line, (None,) for a line to the server itself.
+
+    >>> line_targets('PRIVMSG #a,toto :salut')
+    ('#a', 'toto')
+    >>> line_targets('PONG :irc.example.org')
+    (None,)
+    """
+    command, _, rest = line.partition(' ')
+    if command.upper() in TARGETED and rest:
+        targets = rest.split(' ', 1)[0]
+        return tuple(dict.fromkeys(targets.split(',')))
+    return (None,)
+
+
+class Line:
+    __slots__ = ('seq', 'priority', 'queued', 'text', 'targets', 'future')
+
+    def __init__(self, seq, priority, queued, text, targets, future=None):
+        self.seq = seq
+        self.priority = priority
+        self.queued = queued
+        self.text = text
+        self.targets = targets
+        self.future = future
+
+
+class Queue(collections.deque):
+    """The lines to one target, with how many there are of each priority"""
+
+    def __init__(self):
+        super().__init__()
+        self.counts = [0] * len(PRIORITY_NAMES)
+
+    def urgency(self):
+        return next(priority for priority, count in enumerate(self.counts)
+                    if count)
+
+
+class Output:
+    """Outgoing line scheduler with its own flood control.
+
+    Lines queued during the same loop iteration are packed together before
+    being sent: voice changes to a channel are merged into as few MODE lines
+    as the server allows and an identical message sent to several targets
+    becomes a single multi-target PRIVMSG.
+
+    Lines then go out at the rate given by the flood_* settings of the bot,
+    in order for each target. Targets take turns by the priority of their
+    most urgent line, which rises by one level every AGING seconds that
+    their oldest line waits. Once installed as the send_line of the bot,
+    the lines irc3 sends itself share the same budget.
+    """
+
+    AGING = 5
+
+    def __init__(self, bot):
+        self.bot = bot
+        # target -> Queue, None for the lines to the server itself
+        self.targets = {}
+        self.queued = [0] * len(PRIORITY_NAMES)
+        self.sequence = itertools.count()
+        # (priority, msg, repeat) -> targets, repeat counting the times
+        # the message was already staged for them
+        self.messages = {}
+        self.modes = {}
+        self.flushing = None
+        self.pumping = None
+        self.hostmask = None
+
+        config = bot.config
+        self.burst = max(1, int(config.get('flood_burst', 4)))
+        self.rate = (float(config.get('flood_rate', 1)) /
+                     float(config.get('flood_rate_delay', 1)))
+        self.tokens = self.burst
+        self.refilled = bot.loop.time()
+
+    # ISUPPORT
+
+    @property
+    def server_config(self):
+        return self.bot.config.get('server_config', {})
+
+    def max_modes(self):
+        value = self.server_config.get('MODES', 3)
+        if value is True or value == '':
+            return 12
+        return int(value)
+
+    def max_targets(self, command):
+        for target in str(self.server_config.get('TARGMAX', '')).split(','):
+            name, _, value = target.partition(':')
+            if name == command:
+                return int(value) if value else 12
+        return 1
+
+    def line_length(self):
+        # minus the terminating CRLF
+        return int(self.server_config.get('LINELEN', 512)) - 2
+
+    def text_length(self, command, target):
+        """Room left for the text once relayed to target by the server"""
+        hostmask = self.hostmask
+        if hostmask is None:
+            hostmask = ' ' * (len(self.bot.nick or '') + USER_HOST_LENGTH)
+        prefix = f':{hostmask} {command} {target} :'
+        return self.line_length() - len(prefix.encode())
+
+    # staging
+
+    def privmsg(self, target, msg, priority=NORMAL):
+        if not msg:
+            return
+        repeat = 0
+        while target in self.messages.get((priority, msg, repeat), ()):
+            repeat += 1
+        self.messages.setdefault((priority, msg, repeat), {})[target] = None
+        self.schedule()
+
+    def mode(self, channel, mode, *nicks, priority=COSMETIC):
+        sign, mode = mode
+        changes = self.modes.setdefault((priority, channel), {})
+        for nick in nicks:
+            # only the last change for a nick matters
+            changes.pop((mode, nick), None)
+            changes[(mode, nick)] = sign
+        self.schedule()
+
+    def send_line(self, data, nowait=False):
+        """Stand-in for IrcBot.send_line: lines for which the caller
+        doesn't wait are counted, but not held back"""
+        data = data.replace('\n', ' ').replace('\r', ' ')
+        future = self.bot.loop.create_future()
+        if nowait:
+            self.refill()
+            self.tokens -= 1
+            self.bot.send(data)
+            future.set_result(True)
+            return future
+        # after what was staged before
+        self.flush()
+        targets = line_targets(data)
+        priority = CRITICAL if targets == (None,) else NORMAL
+        self.enqueue(priority, targets, data, future)
+        self.pump()
+        return future
+
+    def enqueue(self, priority, targets, text, future=None):
+        line = Line(next(self.sequence), priority, self.bot.loop.time(),
+                    text, targets, future)
+        for target in targets:
+            queue = self.targets.get(target)
+            if queue is None:
+                queue = self.targets[target] = Queue()
+            queue.append(line)
+            queue.counts[priority] += 1
+        self.queued[priority] += 1
+
+    def schedule(self):
+        if self.flushing is None:
+            self.flushing = self.bot.loop.call_soon(self.flush)
+
+    def flush(self):
+        if self.flushing is not None:
+            self.flushing.cancel()
+            self.flushing = None
+
+        messages, self.messages = self.messages, {}
+        for (priority, msg, repeat), targets in messages.items():
+            longest = max(targets, key=lambda target: len(target.encode()))
+            for text in pack_words(msg, self.text_length('PRIVMSG', longest)):
+                for to, line in self.pack_privmsg(targets, text):
+                    self.enqueue(priority, to, line)
+
+        modes, self.modes = self.modes, {}
+        for (priority, channel), changes in modes.items():
+            for line in self.pack_modes(channel, changes):
+                self.enqueue(priority, (channel,), line)
+
+        self.pump()
+
+    # packing
+
+    def pack_privmsg(self, targets, msg):
+        per_line = self.max_targets('PRIVMSG')
+        limit = self.line_length()
+        line = []
+        for target in targets:
+            if line and (len(line) == per_line or len(self.privmsg_line(
+                    line + [target], msg).encode()) > limit):
+                yield tuple(line), self.privmsg_line(line, msg)
+                line = []
+            line.append(target)
+        if line:
+            yield tuple(line), self.privmsg_line(line, msg)
+
+    @staticmethod
+    def privmsg_line(targets, msg):
+        return f"PRIVMSG {','.join(targets)} :{msg}"
+
+    def pack_modes(self, channel, changes):
+        per_line = self.max_modes()
+        limit = self.line_length()
+        # group by sign so that a line reads like +vvv-vv
+        changes = sorted(((sign, mode, nick)
+                          for (mode, nick), sign in changes.items()),
+                         key=lambda change: change[0] != '+')
+        line = []
+        for change in changes:
+            if line and (len(line) == per_line or len(self.mode_line(
+                    channel, line + [change]).encode()) > limit):
+                yield self.mode_line(channel, line)
+                line = []
+            line.append(change)
+        if line:
+            yield self.mode_line(channel, line)
+
+    @staticmethod
+    def mode_line(channel, changes):
+        flags = ''
+        last_sign = None
+        for sign, mode, nick in changes:
+            if sign != last_sign:
+                flags += sign
+                last_sign = sign
+            flags += mode
+        nicks = ' '.join(nick for sign, mode, nick in changes)
+        return f"MODE {channel} {flags} {nicks}"
+
+    # flood control
+
+    def refill(self):
+        now = self.bot.loop.time()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def pump(self):
+        if self.pumping is not None:
+            self.pumping.cancel()
+            self.pumping = None
+        self.refill()
+        while self.targets and self.tokens >= 1:
+            self.tokens -= 1
+            line = self.next_line()
+            self.pop(line)
+            REGISTRY.observe('cadavre_output_wait_seconds',
+                             self.refilled - line.queued,
+                             priority=PRIORITY_NAMES[line.priority])
+            self.bot.send(line.text)
+            if line.future is not None and not line.future.done():
+                line.future.set_result(True)
+        if self.targets:
+            delay = (1 - self.tokens) / self.rate
+            self.pumping = self.bot.loop.call_later(delay, self.pump)
+
+    def next_line(self):
+        """The first line of the most urgent target.
+
+        A line to several targets waits to be first for all of them. The
+        oldest of the first lines always is, as lines are queued to all
+        their targets at once.
+        """
+        best = None
+        best_key = None
+        for queue in self.targets.values():
+            line = queue[0]
+            if len(line.targets) > 1 and any(
+                    self.targets[target][0] is not line
+                    for target in line.targets):
+                continue
+            waited = self.refilled - line.queued
+            key = (queue.urgency() - waited / self.AGING, line.seq)
+            if best_key is None or key < best_key:
+                best, best_key = line, key
+        return best
+
+    def pop(self, line):
+        for target in line.targets:
+            queue = self.targets[target]
+            queue.popleft()
+            queue.counts[line.priority] -= 1
+            if not queue:
+                del self.targets[target]
+        self.queued[line.priority] -= 1
@@ -0,0 +1,93 @@
+import time
+import collections
+
+__all__ = ['Pacing']
+
+HOUR = 3600
+
+
+class Pacing:
+    """Length of the pauses around the games of a channel.
+
+    The grace period after the last fragment lets players fix theirs: it
+    shrinks with the share of recent games where someone did. The cooldown
+    after the sentence is shown gives time to read it and to join the next
+    game: when that game can start right away, it's cut down to the time
+    needed to read the sentence. Missing fragments are waited for a few
+    times the usual response time of the channel before they're made up.
+    Shares and response times are smoothed over the last games with
+    exponential moving averages.
+    """
+
+    # weight of the last game in the averages
+    ALPHA = .2
+    # characters read per second
+    READING_SPEED = 20
+    # missing fragments are waited for that many times the response time,
+    # but no less than MIN_FILL seconds
+    FILL_FACTOR = 4
+    MIN_FILL = 60
+
+    def __init__(self, grace=4, cooldown=6, min_grace=1, min_cooldown=2):
+        self.grace = grace
+        self.cooldown = cooldown
+        self.min_grace = min(min_grace, grace)
+        self.min_cooldown = min(min_cooldown, cooldown)
+        # until we know better, keep the full grace period
+        self.correction_rate = 1.
+        self.response_time = None
+        self.games = 0
+        self.paused = 0.
+        self.finished = collections.deque()
+
+    def average(self, average, value):
+        if average is None:
+            return value
+        return average + self.ALPHA * (value - average)
+
+    # measures
+
+    def answered(self, delay):
+        """A player gave their fragment delay seconds after the start"""
+        self.response_time = self.average(self.response_time, delay)
+
+    def ended(self, corrected, now=None):
+        """A game ended, corrected if a fragment changed during its grace"""
+        self.correction_rate = self.average(self.correction_rate,
+                                            float(corrected))
+        self.games += 1
+        self.finished.append(time.time() if now is None else now)
+
+    def games_per_hour(self, now=None):
+        now = time.time() if now is None else now
+        while self.finished and self.finished[0] < now - HOUR:
+            self.finished.popleft()
+        return len(self.finished)
+
+    def pause_per_game(self):
+        return self.paused / self.games if self.games else None
+
+    # delays, accounted as paused time
+
+    def grace_delay(self):
+        delay = (self.min_grace +
+                 (self.grace - self.min_grace) * self.correction_rate)
+        self.paused += delay
+        return delay
+
+    def cooldown_delay(self, sentence, ready):
+        """Cooldown after sentence, shorter if the next game is ready"""
+        delay = self.cooldown
+        if ready:
+            delay = max(self.min_cooldown,
+                        min(delay, len(sentence) / self.READING_SPEED))
+        self.paused += delay
+        return delay
+
+    def fill_delay(self, timeout):
+        """How long to wait for the fragments before making them up, at
+        most timeout"""
+        if self.response_time is None:
+            return timeout
+        return min(timeout, max(self.MIN_FILL,
+                                self.FILL_FACTOR * self.response_time))
@@ -0,0 +1,108 @@
+"""Profiling sessions started by the admin commands.
+
+They live here rather than in the admin module so that a reload doesn't
+lose a session in progress. cProfile only sees the thread that enabled it,
+which is the one running the event loop.
+"""
+import os
+import time
+import cProfile
+import pstats
+import tracemalloc
+
+__all__ = ['Profiler', 'PROFILER', 'save_profile', 'save_snapshot']
+
+# how the selectors wait for input in a profile
+IDLE = ("<method 'select' of", "<method 'poll' of", "<method 'control' of")
+
+
+def short_path(path):
+    return os.sep.join(path.split(os.sep)[-2:])
+
+
+class Profiler:
+    def __init__(self):
+        self.profile = None
+        self.timer = None
+        self.snapshot = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        if self.profile is not None:
+            return False
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return True
+
+    def stop(self):
+        """Stop the session, giving its pstats.Stats or None"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        profile, self.profile = self.profile, None
+        if profile is None:
+            return None
+        profile.disable()
+        return pstats.Stats(profile)
+
+    def snap(self):
+        """Take a memory snapshot, tracing allocations from now on if we
+        didn't already, and give it with the one taken before"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.snapshot = None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        previous, self.snapshot = self.snapshot, snapshot
+        return previous, snapshot
+
+    def stop_tracing(self):
+        self.snapshot = None
+        tracemalloc.stop()
+
+
+PROFILER = Profiler()
+
+
+def file_name(directory, kind):
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, f'{kind}-{stamp}')
+
+
+def save_profile(stats, directory, count):
+    """Write stats to a file, give its path and the count functions that
+    took the most time"""
+    path = file_name(directory, 'profile') + '.prof'
+    stats.dump_stats(path)
+    # by time spent in the function itself, leaving out the loop waiting
+    rows = sorted(((key, row) for key, row in stats.stats.items()
+                   if not key[2].startswith(IDLE)),
+                  key=lambda row: row[1][2], reverse=True)
+    lines = []
+    for (file, line, function), (_, calls, own, total, _) in rows[:count]:
+        lines.append(f'{own * 1000:.1f}ms ({total * 1000:.1f}ms in all) '
+                     f'{calls}x {short_path(file)}:{line} {function}')
+    return path, lines
+
+
+def save_snapshot(previous, snapshot, directory, count):
+    """Write snapshot to a file, give its path and the count lines that
+    allocated the most since previous (or at all)"""
+    path = file_name(directory, 'memory') + '.snapshot'
+    snapshot.dump(path)
+    if previous is None:
+        stats = snapshot.statistics('lineno')
+        lines = [f'{stat.size / 1024:.1f}KiB in {stat.count} blocks '
+                 f'{short_path(stat.traceback[0].filename)}:'
+                 f'{stat.traceback[0].lineno}' for stat in stats[:count]]
+    else:
+        stats = snapshot.compare_to(previous, 'lineno')
+        lines = [f'{stat.size_diff / 1024:+.1f}KiB '
+                 f'({stat.size / 1024:.1f}KiB in {stat.count} blocks) '
+                 f'{short_path(stat.traceback[0].filename)}:'
+                 f'{stat.traceback[0].lineno}' for stat in stats[:count]]
+    return path, lines
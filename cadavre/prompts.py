@@ -0,0 +1,64 @@
+"""Prompts sent to the players at the start of a game.
+
+There are few of them: one per mode, piece of the mode and agreement of the
+piece. They are all built at import, with a placeholder for each example
+fragment of the phrase, the one of the player in bold green.
+"""
+from . import data
+from .irc_colors import IRCColors as colors
+
+__all__ = ['PROMPTS', 'prompt']
+
+GENDER_NAMES = {True: "masculin", False: "féminin"}
+PLURALITY_NAMES = {True: "singulier", False: "pluriel"}
+
+
+def agreements(piece):
+    """The (gender, plurality) a piece can be asked with"""
+    if piece == 'Cc':
+        return [(None, None)]
+    return [(gender, plurality)
+            for gender in (True, False) for plurality in (True, False)]
+
+
+def instruction(piece, gender, plurality):
+    tune = ''
+    if piece == 'V':
+        tune = (f" conjugué au {GENDER_NAMES[gender]} à la 3è personne "
+                f"du {PLURALITY_NAMES[plurality]}")
+    elif piece != 'Cc':
+        tune = (f" accordé au {GENDER_NAMES[gender]} "
+                f"{PLURALITY_NAMES[plurality]}")
+    return (f"donne-moi un {data.PIECES[piece]}{tune} "
+            f"convenant à cette phrase: ")
+
+
+def build(mode):
+    prompts = {}
+    for index, piece in enumerate(mode):
+        slots = ['{}'] * len(mode)
+        slots[index] = colors.bold_green('{}')
+        phrase = ' '.join(slots)
+        for gender, plurality in agreements(piece):
+            text = instruction(piece, gender, plurality)
+            prompts[len(mode), piece, gender, plurality] = (
+                text.replace('{', '{{').replace('}', '}}') + phrase)
+    return prompts
+
+
+# (mode size, piece, gender, plurality) -> str.format template
+PROMPTS = {}
+for mode in data.MODES.values():
+    PROMPTS.update(build(mode))
+
+
+def prompt(piece, gender, plurality, fragments):
+    """
+    The prompt for piece, with the example fragments of the whole phrase.
+
+    >>> colors.strip(prompt('V', True, False, ['ils', 'dorment', 'là']))
+    'donne-moi un verbe conjugué au masculin à la 3è personne du pluriel \
+convenant à cette phrase: ils dorment là'
+    """
+    return PROMPTS[len(fragments), piece, gender, plurality].format(
+        *fragments)
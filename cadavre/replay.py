@@ -0,0 +1,283 @@
+"""Record the IRC traffic of the bot and replay it deterministically.
+
+With the record option set, the lines the bot gets and sends are appended
+to a trace file, after a header with the seed of the random generator,
+which is reseeded when the recording starts. Each run of the bot appends
+a new session to the trace. Replaying a session feeds the recorded lines
+to a fresh bot at their recorded times on a virtual clock, so a game of
+several minutes replays in milliseconds, then checks that the bot sent the
+same lines:
+
+    python -m cadavre.replay trace.jsonl [<session>]
+
+The last session is replayed unless another one is given, counting from 0
+or backwards from -1.
+
+The archive, checkpoint, metrics and watchdog are disabled in replays.
+
+offline() connects a bot to nothing but a Transport keeping what it sends,
+as replays do, for the tests and benchmarks.
+"""
+import os
+import sys
+import json
+import time
+import random
+import selectors
+
+import asyncio
+import irc3
+
+__all__ = ['Recorder', 'Clock', 'Transport', 'offline', 'replay']
+
+# what is kept of the configuration of the bot
+CONFIG_KEYS = ('nick', 'username', 'cmd', 'includes', 'autojoins',
+               'autojoin_delay', 'flood_burst', 'flood_rate',
+               'flood_rate_delay')
+CONFIG_SECTIONS = ('irc3.plugins.command', 'cadavre.guard.masks',
+                   'cadavre.bot', 'cadavre.admin')
+# options of cadavre.bot that make no sense in a replay
+DISABLED = ('corpus', 'archive', 'checkpoint', 'record', 'metrics',
+            'metrics_port', 'watchdog')
+
+
+def trace_config(config):
+    kept = {key: config[key] for key in CONFIG_KEYS if key in config}
+    for section in CONFIG_SECTIONS:
+        kept[section] = dict(config.get(section, {}))
+    return kept
+
+
+class Recorder:
+    """Append the lines the bot gets and sends to a trace file.
+
+    The lines received in one iteration of the loop (read at once) get the
+    same time, so that they're replayed together.
+    """
+
+    def __init__(self, path, loop, config):
+        self.loop = loop
+        self.start = loop.time()
+        self.received = None
+        torn = False
+        try:
+            with open(path, 'rb') as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b'\n'
+        except FileNotFoundError:
+            pass
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+        if torn:
+            # a crash cut the last session, start this one on its own line
+            self.file.write('\n')
+        seed = int.from_bytes(os.urandom(8), 'little')
+        random.seed(seed)
+        self.write(dict(seed=seed, time=time.time(),
+                        config=trace_config(config)))
+
+    def line(self, direction, raw):
+        now = self.loop.time()
+        if direction == 'in':
+            if self.received is None:
+                self.received = now
+                self.loop.call_soon(self.iterated)
+            now = self.received
+        self.write({'t': round(now - self.start, 6), direction: raw})
+
+    def iterated(self):
+        self.received = None
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def read_trace(path, session=-1):
+    """Header and events of a session of the trace"""
+    sessions = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # torn by a crash, the session ended there
+                continue
+            if 'seed' in event:
+                sessions.append((event, []))
+            elif sessions:
+                sessions[-1][1].append(event)
+    if not sessions:
+        raise ValueError(f'{path} holds no session')
+    return sessions[session]
+
+
+class Clock:
+    """Virtual time, standing in for the time module"""
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+        # kept small so that it can move by tiny steps
+        self.now = 0.
+
+    def time(self):
+        return self.epoch + self.now
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class Selector(selectors.BaseSelector):
+    """Never waits for input: the clock jumps to the next timer instead"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.keys = {}
+
+    def register(self, fileobj, events, data=None):
+        key = selectors.SelectorKey(fileobj, fileobj if isinstance(
+            fileobj, int) else fileobj.fileno(), events, data)
+        self.keys[fileobj] = key
+        return key
+
+    def unregister(self, fileobj):
+        return self.keys.pop(fileobj)
+
+    def get_map(self):
+        return self.keys
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # only threads can wake us up
+            time.sleep(.001)
+        else:
+            # each iteration of the loop takes a little time, as it would
+            # with a real clock
+            self.clock.now += max(timeout, 1e-6)
+        return []
+
+
+class Loop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        self.clock = clock
+        super().__init__(Selector(clock))
+
+    def time(self):
+        return self.clock.now
+
+
+class Transport:
+    """Stands in for the connection to the server, keeping the lines sent"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.extend(data.decode().split('\r\n')[:-1])
+
+    def close(self):
+        pass
+
+
+def offline(bot, transport=None):
+    """Have bot send to transport as if connected to a server, and give the
+    transport. The plugins are left to be notified of the connection."""
+    if transport is None:
+        transport = Transport()
+    bot.protocol = irc3.IrcConnection()
+    bot.protocol.closed = False
+    bot.protocol.factory = bot
+    bot.protocol.encoding = bot.encoding
+    bot.protocol.transport = transport
+    return transport
+
+
+def split(raw):
+    return [line for line in raw.split('\r\n') if line]
+
+
+def patch_time(clock):
+    """Have the cadavre modules read clock instead of time"""
+    patched = []
+    for name, module in list(sys.modules.items()):
+        if (name.startswith('cadavre.') and name != __name__
+                and getattr(module, 'time', None) is time):
+            module.time = clock
+            patched.append(module)
+    return patched
+
+
+def replay(path, session=-1):
+    """Replay a session of a trace, give the recorded and the replayed lines
+    sent by the bot, and how long the replay took"""
+    header, events = read_trace(path, session)
+    clock = Clock(header['time'])
+    loop = Loop(clock)
+    asyncio.set_event_loop(loop)
+
+    config = header['config']
+    bot_config = dict(config['cadavre.bot'])
+    for option in DISABLED:
+        bot_config.pop(option, None)
+    bot = irc3.IrcBot(**dict(config, loop=loop, testing=True, level=1000,
+                             **{'cadavre.bot': bot_config}))
+    transport = offline(bot)
+
+    patched = patch_time(clock)
+    try:
+        random.seed(header['seed'])
+        started = time.perf_counter()
+        bot.notify('connection_made')
+        start = loop.time()
+        end = 0
+        recorded = []
+        received = {}
+        for event in events:
+            if 'in' in event:
+                # lines received at once are dispatched at once
+                received.setdefault(event['t'], []).append(event['in'])
+            else:
+                recorded.extend(split(event['out']))
+            end = max(end, event['t'])
+        for t, lines in received.items():
+            loop.call_at(start + t, dispatch, bot, lines)
+        # the recording stopped there, leave a little time for the last
+        # lines to get answers
+        done = loop.create_future()
+        loop.call_at(start + end + 1, done.set_result, None)
+        loop.run_until_complete(done)
+        elapsed = time.perf_counter() - started
+    finally:
+        for module in patched:
+            module.time = time
+        loop.close()
+    return recorded, transport.lines, elapsed
+
+
+def dispatch(bot, lines):
+    for line in lines:
+        bot.dispatch(line)
+
+
+def main(path, session=-1):
+    recorded, replayed, elapsed = replay(path, session)
+    for i, (expected, got) in enumerate(zip(recorded, replayed)):
+        if expected != got:
+            print(f'line {i + 1} differs:\n  recorded {expected!r}\n'
+                  f'  replayed {got!r}')
+            return 1
+    print(f'{len(replayed)} lines replayed in {elapsed:.3f}s')
+    if len(recorded) != len(replayed):
+        print(f'but {len(recorded)} lines were recorded')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit(f'usage: {sys.argv[0]} <trace.jsonl> [<session>]')
+    sys.exit(main(*sys.argv[1:2], *map(int, sys.argv[2:])))
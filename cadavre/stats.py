@@ -0,0 +1,220 @@
+import math
+
+__all__ = ['Sketch', 'PlayerStats', 'Stats']
+
+
+class Sketch:
+    """
+    Streaming quantiles of positive values, within a relative accuracy.
+
+    Values are counted in buckets whose bounds grow geometrically, so that
+    any value of a bucket is within accuracy of its middle. Memory is
+    bounded by collapsing the lowest buckets together, and two sketches of
+    the same accuracy are merged by adding their counts, whatever the order
+    the values came in.
+
+    >>> sketch = Sketch()
+    >>> for value in range(1, 101):
+    ...     sketch.add(value)
+    >>> round(sketch.quantile(.5)), round(sketch.quantile(.9))
+    (49, 90)
+    >>> other = Sketch()
+    >>> other.add(1000)
+    >>> sketch.merge(other)
+    >>> sketch.count, round(sketch.quantile(1))
+    (101, 993)
+    """
+
+    # values below are counted as this one
+    MIN_VALUE = 1e-3
+
+    def __init__(self, accuracy=.02, max_buckets=256):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+
+    def key(self, value):
+        return math.ceil(math.log(max(value, self.MIN_VALUE)) /
+                         self.log_gamma)
+
+    def add(self, value, count=1):
+        key = self.key(value)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += count
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        # the lowest values lose their accuracy first, make room for a
+        # while so that adding stays constant time on average
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets * 3 // 4
+        lowest = keys[excess]
+        for key in keys[:excess]:
+            self.buckets[lowest] += self.buckets.pop(key)
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError('cannot merge sketches of different accuracies')
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+        while len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def quantile(self, q):
+        """Value below which are q of the values, None if there's none"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                break
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def to_state(self):
+        return dict(accuracy=self.accuracy, count=self.count,
+                    buckets={str(key): count
+                             for key, count in self.buckets.items()})
+
+    @classmethod
+    def from_state(cls, state):
+        self = cls(state['accuracy'])
+        self.count = state['count']
+        self.buckets = {int(key): count
+                        for key, count in state['buckets'].items()}
+        return self
+
+
+class PlayerStats:
+    def __init__(self, nick):
+        self.nick = nick
+        self.games = 0
+        self.aborts = 0
+        self.blames = 0
+        self.delays = Sketch()
+
+    def merge(self, other):
+        self.games += other.games
+        self.aborts += other.aborts
+        self.blames += other.blames
+        self.delays.merge(other.delays)
+
+    def to_state(self):
+        return dict(nick=self.nick, games=self.games, aborts=self.aborts,
+                    blames=self.blames, delays=self.delays.to_state())
+
+    @classmethod
+    def from_state(cls, state):
+        self = cls(state['nick'])
+        self.games = state['games']
+        self.aborts = state['aborts']
+        self.blames = state['blames']
+        self.delays = Sketch.from_state(state['delays'])
+        return self
+
+
+class Stats:
+    """Response times and counts of the players, and response times of
+    each piece, kept in constant memory per player.
+
+    Whenever the stats of a player or of a piece change, changed is called
+    with their key, 'player:<nick>' or 'piece:<piece>', under which they
+    are saved and restored.
+    """
+
+    def __init__(self, changed=None):
+        self.players = {}
+        self.pieces = {}
+        self.changed = changed
+
+    def touch(self, key):
+        if self.changed is not None:
+            self.changed(key)
+
+    def player(self, nick):
+        key = nick.lower()
+        stats = self.players.get(key)
+        if stats is None:
+            stats = self.players[key] = PlayerStats(nick)
+        stats.nick = nick
+        self.touch('player:' + key)
+        return stats
+
+    def get(self, nick):
+        return self.players.get(nick.lower())
+
+    def answered(self, nick, piece, delay):
+        self.player(nick).delays.add(delay)
+        sketch = self.pieces.get(piece)
+        if sketch is None:
+            sketch = self.pieces[piece] = Sketch()
+        sketch.add(delay)
+        self.touch('piece:' + piece)
+
+    def played(self, nick):
+        self.player(nick).games += 1
+
+    def aborted(self, nick):
+        self.player(nick).aborts += 1
+
+    def blamed(self, nick):
+        self.player(nick).blames += 1
+
+    def load(self, games):
+        """Count the (players, pieces, delays) of archived games"""
+        for players, pieces, delays in games:
+            for nick, piece, delay in zip(players, pieces, delays):
+                if delay is None:
+                    self.aborted(nick)
+                else:
+                    self.answered(nick, piece, delay)
+                    self.played(nick)
+        return self
+
+    def merge(self, other):
+        """Add the counts of other, keeping the nicks seen last here"""
+        for key, stats in other.players.items():
+            mine = self.players.get(key)
+            if mine is None:
+                self.players[key] = stats
+            else:
+                mine.merge(stats)
+            self.touch('player:' + key)
+        for piece, sketch in other.pieces.items():
+            mine = self.pieces.get(piece)
+            if mine is None:
+                self.pieces[piece] = sketch
+            else:
+                mine.merge(sketch)
+            self.touch('piece:' + piece)
+
+    def to_state(self, key=None):
+        """State of the stats under key, of all of them by key if None"""
+        if key is None:
+            keys = ['player:' + key for key in self.players]
+            keys += ['piece:' + piece for piece in self.pieces]
+            return {key: self.to_state(key) for key in keys}
+        kind, _, name = key.partition(':')
+        stats = (self.players if kind == 'player' else self.pieces).get(name)
+        return None if stats is None else stats.to_state()
+
+    def from_state(self, key, state):
+        kind, _, name = key.partition(':')
+        if kind == 'player':
+            self.players[name] = PlayerStats.from_state(state)
+        elif kind == 'piece':
+            self.pieces[name] = Sketch.from_state(state)
+
+    def top(self, count, min_games=3):
+        """The count fastest players by median response time"""
+        ranked = [(stats.delays.quantile(.5), stats)
+                  for stats in self.players.values()
+                  if stats.delays.count >= min_games]
+        ranked.sort(key=lambda ranked: ranked[0])
+        return ranked[:count]
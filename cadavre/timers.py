@@ -0,0 +1,79 @@
+import time
+import heapq
+import itertools
+
+
+class DeadlineHeap:
+    """Fire a callback for each key when its wall-clock deadline is reached.
+
+    Deadlines are kept in a heap and only the earliest one is armed on the
+    event loop, so nothing runs while nothing is due. Cancelled entries are
+    left in the heap and skipped when they reach the top.
+    """
+
+    def __init__(self, loop, callback):
+        self.loop = loop
+        self.callback = callback
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.handle = None
+        self.armed = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def schedule(self, key, deadline):
+        self.discard(key)
+        entry = [deadline, next(self.counter), key, True]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        self.arm()
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        entry[-1] = False
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.heap = [entry for entry in self.heap if entry[-1]]
+            heapq.heapify(self.heap)
+        self.arm()
+
+    def clear(self):
+        self.heap = []
+        self.entries = {}
+        self.arm()
+
+    def arm(self):
+        while self.heap and not self.heap[0][-1]:
+            heapq.heappop(self.heap)
+
+        deadline = self.heap[0][0] if self.heap else None
+        if deadline == self.armed:
+            return
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.armed = deadline
+        if deadline is not None:
+            delay = max(0, deadline - time.time())
+            self.handle = self.loop.call_at(self.loop.time() + delay,
+                                            self.fire)
+
+    def fire(self):
+        self.handle = None
+        self.armed = None
+        now = time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, key, alive = heapq.heappop(self.heap)
+            if alive:
+                del self.entries[key]
+                due.append(key)
+        for key in due:
+            self.callback(key)
+        self.arm()
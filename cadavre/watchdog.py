@@ -0,0 +1,92 @@
+import sys
+import time
+import functools
+import threading
+import traceback
+
+import irc3
+
+from .metrics import REGISTRY
+
+__all__ = ['Watchdog', 'offloadable']
+
+REGISTRY.describe('cadavre_loop_lag_seconds', 'histogram',
+                  'How late the event loop runs its callbacks')
+REGISTRY.describe('cadavre_loop_stalls_total', 'counter',
+                  'Times the event loop was blocked, by handler')
+
+
+class Watchdog:
+    """Measure how late the event loop runs its callbacks.
+
+    A callback scheduled every interval measures its own lateness. A thread
+    checks that it keeps running: when it hasn't for threshold seconds, the
+    loop is blocked and the thread captures the stack of the loop thread,
+    along with the handler the metrics say is running. Both are given to
+    report(lag, handler, stack) once the loop is back.
+    """
+
+    def __init__(self, loop, report, threshold=.5, interval=.1):
+        self.loop = loop
+        self.report = report
+        self.threshold = threshold
+        self.interval = interval
+        self.thread = None
+        self.thread_id = None
+        self.expected = None
+        self.last = None
+        self.stall = None
+
+    def start(self):
+        """Start watching the loop, from the thread running it"""
+        if self.thread is not None:
+            return
+        self.thread_id = threading.get_ident()
+        self.beat()
+        self.thread = threading.Thread(target=self.watch, name='watchdog',
+                                       daemon=True)
+        self.thread.start()
+
+    def beat(self):
+        now = self.loop.time()
+        lag = 0
+        if self.expected is not None:
+            lag = max(0, now - self.expected)
+            REGISTRY.observe('cadavre_loop_lag_seconds', lag)
+        self.last = time.monotonic()
+        self.expected = now + self.interval
+        self.loop.call_later(self.interval, self.beat)
+
+        stall, self.stall = self.stall, None
+        if stall is not None:
+            handler, stack = stall
+            REGISTRY.inc('cadavre_loop_stalls_total',
+                         handler=handler or 'unknown')
+            self.report(lag, handler, stack)
+
+    def watch(self):
+        captured = None
+        while True:
+            time.sleep(self.interval / 2)
+            last = self.last
+            if last == captured or time.monotonic() - last < self.threshold:
+                continue
+            # once per stall
+            captured = last
+            handler = REGISTRY.current
+            frame = sys._current_frames().get(self.thread_id)
+            stack = traceback.extract_stack(frame) if frame else []
+            self.stall = (handler, stack)
+
+
+def offloadable(func):
+    """Run the command func in a thread when it's named in the offload
+    option, func must not touch the state of the bot"""
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        offload = irc3.utils.as_list(self.config.get('offload', ''))
+        if func.__name__ in offload:
+            return await self.bot.loop.run_in_executor(
+                None, functools.partial(func, self, *args, **kwargs))
+        return func(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,65 @@
+import copy
+import asyncio
+
+import irc3
+import pytest
+
+from cadavre.bot import Cadavre
+from cadavre.replay import offline
+
+CONFIG = dict(
+    nick='bot', username='bot', cmd='!', includes=['cadavre.bot'],
+    flood_burst=1000, flood_rate=10 ** 6, level=1000,
+)
+CONFIG['irc3.plugins.command'] = {'cmd': '!'}
+CONFIG['cadavre.bot'] = {'grace_period': 0, 'cooldown': 0}
+
+
+class Bot(irc3.IrcBot):
+    """A bot connected to nothing, fed lines by hand"""
+
+    @property
+    def plugin(self):
+        return self.get_plugin(Cadavre)
+
+    @property
+    def sent(self):
+        return self.protocol.transport.lines
+
+    def feed(self, *lines):
+        for line in lines:
+            self.dispatch(line)
+        self.run()
+
+    def run(self, seconds=0):
+        """Run the loop for a while, by default what's ready on it"""
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def join(self, channel, *nicks):
+        """Have the bot join channel, along with nicks"""
+        names = ' '.join(('bot',) + nicks)
+        self.feed(f':bot!b@h JOIN {channel}',
+                  f':srv 353 bot = {channel} :{names}',
+                  f':srv 366 bot {channel} :End of /NAMES list.')
+
+
+@pytest.fixture
+def config():
+    """The configuration of the bot, to be overridden"""
+    return copy.deepcopy(CONFIG)
+
+
+@pytest.fixture
+def bot(config):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = Bot(loop=loop, testing=True, **config)
+    offline(bot)
+    bot.notify('connection_made')
+    yield bot
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+    asyncio.set_event_loop(None)
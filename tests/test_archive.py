@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from cadavre.archive import Archive
+
+PIECES = ['S', 'V', 'C']
+
+
+@pytest.fixture
+def archive(tmp_path):
+    loop = asyncio.new_event_loop()
+    archive = Archive(str(tmp_path / 'archive.sqlite'), loop)
+    yield archive
+    archive.executor.shutdown()
+    loop.close()
+
+
+def wait(archive, future):
+    return archive.loop.run_until_complete(future)
+
+
+def record(archive, channel, *parts, players=('a', 'b', 'c')):
+    return wait(archive, archive.record(
+        channel, 1e9, 42, list(players), PIECES, list(parts), [1., None, 2.]))
+
+
+def test_storage(archive):
+    game_id = record(archive, '#a', 'le pape', 'danse avec', 'les sirènes')
+    stored = wait(archive, archive.get('#a', game_id))
+    assert stored.id == game_id and stored.channel == '#a'
+    assert stored.seed == 42 and stored.players == ['a', 'b', 'c']
+    assert stored.parts == ['le pape', 'danse avec', 'les sirènes']
+    assert stored.delays == [1., None, 2.]
+
+
+def test_get_scoped_to_channel(archive):
+    game_id = record(archive, '#a', 'le pape', 'danse', 'ici')
+    assert wait(archive, archive.get('#b', game_id)) is None
+    assert wait(archive, archive.get('#a', game_id + 1)) is None
+
+
+def test_history_newest_first(archive):
+    ids = [record(archive, channel, 'le pape', 'danse', f'{i}')
+           for i, channel in enumerate(['#a', '#b', '#a', '#a'])]
+    history = wait(archive, archive.history('#a', 2))
+    assert [stored.id for stored in history] == [ids[3], ids[2]]
+
+
+def test_by_player(archive):
+    first = record(archive, '#a', 'x', 'y', 'z', players=('Toto', 'b', 'c'))
+    record(archive, '#a', 'x', 'y', 'z')
+    record(archive, '#b', 'x', 'y', 'z', players=('toto', 'b', 'c'))
+    found = wait(archive, archive.by_player('#a', 'TOTO', 5))
+    assert [stored.id for stored in found] == [first]
+
+
+def test_reveal_other_channel(bot, tmp_path):
+    bot.plugin.archive = archive = Archive(str(tmp_path / 'a.sqlite'),
+                                           bot.loop)
+    bot.join('#a')
+    bot.join('#b')
+    game_id = bot.loop.run_until_complete(archive.record(
+        '#a', 1e9, 42, ['a', 'b', 'c'], PIECES,
+        ['le pape', 'danse avec', 'les sirènes'], [1., 1., 1.]))
+    bot.feed(f':x!u@h PRIVMSG #b :!reveal {game_id}')
+    bot.run(.1)
+    assert bot.sent[-1] == "PRIVMSG #b :je n'ai rien dans le sac"
+    bot.feed(f':x!u@h PRIVMSG #a :!reveal {game_id}')
+    bot.run(.1)
+    assert bot.sent[-2] == f'PRIVMSG #a :phrase #{game_id} par a, b, c:'
+    archive.executor.shutdown()
+
+
+def search(archive, channel, text, count=5):
+    return [stored.id for stored in
+            wait(archive, archive.search(channel, text, count))]
+
+
+def test_search_ranking(archive):
+    both = record(archive, '#a', 'le pape', 'danse avec', 'la voisine')
+    pape = record(archive, '#a', 'le pape', 'dort', 'ici')
+    record(archive, '#a', 'un chat', 'dort', 'ici')
+    newer = record(archive, '#a', 'la voisine', 'dort', 'ici')
+    record(archive, '#b', 'le pape', 'danse avec', 'la voisine')
+    # most words first, newest first among equals, accents ignored
+    assert search(archive, '#a', 'Pape VOISINÉ') == [both, newer, pape]
+    assert search(archive, '#a', 'pape voisine', 1) == [both]
+    assert search(archive, '#a', 'zorglub') == []
+    assert search(archive, '#a', '') == []
+
+
+def test_search_common_words(archive, monkeypatch):
+    monkeypatch.setattr(Archive, 'SEARCH_WALK', 3)
+    old = record(archive, '#a', 'le pape', 'danse avec', 'le chat')
+    for i in range(5):
+        record(archive, '#a', 'le chien', 'dort', f'{i}')
+    newest = record(archive, '#a', 'le chat', 'dort', 'ici')
+    # the old game is past the walk of "le", but "pape" brings it and it
+    # still counts as matching "le"
+    assert search(archive, '#a', 'le pape', 2)[0] == old
+    assert search(archive, '#a', 'le chat', 2) == [newest, old]
+    # matched by common words alone, it's past every walk
+    assert old not in search(archive, '#a', 'le dort')
@@ -0,0 +1,70 @@
+import asyncio
+
+from cadavre.checkpoint import Checkpoint
+
+
+def checkpoint(tmp_path, **kwargs):
+    loop = asyncio.new_event_loop()
+    return loop, Checkpoint(str(tmp_path / 'state.json'), loop, **kwargs)
+
+
+def write(loop, checkpoint, states):
+    loop.run_until_complete(checkpoint.write(states))
+
+
+def test_replay_and_delete(tmp_path):
+    loop, first = checkpoint(tmp_path)
+    first.load()
+    write(loop, first, {'#a': {'state': 1}, '#b': {'state': 2}})
+    write(loop, first, {'#a': {'state': 3}, '#b': None})
+    loop, second = checkpoint(tmp_path)
+    assert second.load() == {'#a': {'state': 3}}
+
+
+def test_torn_line_cut_off(tmp_path):
+    loop, first = checkpoint(tmp_path)
+    first.load()
+    write(loop, first, {'#a': {'state': 1}})
+    with open(first.journal_path, 'a', encoding='utf-8') as f:
+        f.write('["#a", {"sta')
+
+    loop, second = checkpoint(tmp_path)
+    assert second.load() == {'#a': {'state': 1}}
+    # appended after the last whole line, not onto the fragment
+    write(loop, second, {'#b': {'state': 2}})
+    loop, third = checkpoint(tmp_path)
+    assert third.load() == {'#a': {'state': 1}, '#b': {'state': 2}}
+
+
+def test_line_without_newline_is_torn(tmp_path):
+    loop, first = checkpoint(tmp_path)
+    first.load()
+    with open(first.journal_path, 'w', encoding='utf-8') as f:
+        f.write('["#a", 1]\n["#b", 2]')
+    assert first.load() == {'#a': 1}
+    write(loop, first, {'#c': 3})
+    loop, second = checkpoint(tmp_path)
+    assert second.load() == {'#a': 1, '#c': 3}
+
+
+def test_compaction(tmp_path):
+    loop, first = checkpoint(tmp_path, compact_after=2)
+    first.load()
+    write(loop, first, {'#a': 1, '#b': 2})
+    assert first.records == 0
+    with open(first.journal_path) as f:
+        assert f.read() == ''
+    write(loop, first, {'#b': None, 'é': 'à'})
+    loop, second = checkpoint(tmp_path)
+    assert second.load() == {'#a': 1, 'é': 'à'}
+
+
+def test_states_serialized_when_written(tmp_path):
+    loop, first = checkpoint(tmp_path, compact_after=1)
+    first.load()
+    state = {'players': ['a']}
+    future = first.write({'#a': state})
+    state['players'].append('b')
+    loop.run_until_complete(future)
+    loop, second = checkpoint(tmp_path)
+    assert second.load() == {'#a': {'players': ['a']}}
@@ -0,0 +1,56 @@
+import pytest
+
+from cadavre.corpus import Corpus, build, read_tsv
+
+TSV = '''\
+# piece, gender, plurality, fragment
+S\tm\ts\tle pape
+S\tf\tp\tles sorcières
+S\tm\ts\tun évêque
+V\tf\tp\tsont amusées par
+Cc\t-\t-\tprès du lampadaire
+'''
+
+
+class Index:
+    """Stands in for the random generator, picking a given index"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def randrange(self, size):
+        assert 0 <= self.index < size
+        return self.index
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    tsv = tmp_path / 'fragments.tsv'
+    tsv.write_text(TSV, encoding='utf-8')
+    path = str(tmp_path / 'corpus.bin')
+    build(read_tsv(str(tsv)), path)
+    return Corpus(path)
+
+
+def test_round_trip(corpus):
+    assert len(corpus) == 5
+    assert [corpus.choice('S', True, True, Index(i)) for i in range(2)] == [
+        'le pape', 'un évêque']
+    assert corpus.choice('S', False, False, Index(0)) == 'les sorcières'
+    assert corpus.choice('V', False, False, Index(0)) == 'sont amusées par'
+    assert corpus.choice('Cc', None, None, Index(0)) == 'près du lampadaire'
+
+
+def test_lookups(corpus):
+    assert ('S', True, True) in corpus
+    assert ('S', True, False) not in corpus
+    with pytest.raises(KeyError):
+        corpus.choice('C', True, True)
+    assert corpus.choice('S', True, True) in ('le pape', 'un évêque')
+
+
+def test_not_a_corpus(tmp_path):
+    path = tmp_path / 'corpus.bin'
+    path.write_bytes(b'NOPE' + bytes(20))
+    with pytest.raises(ValueError):
+        Corpus(str(path))
@@ -0,0 +1,81 @@
+import pytest
+from irc3.plugins.command import Commands
+from irc3.utils import IrcString
+
+from cadavre.guard import policy, ALL
+
+
+@pytest.fixture
+def config(config):
+    config['irc3.plugins.command']['guard'] = 'cadavre.guard.policy'
+    config[policy.key] = {'*!*@admin': ALL, '*': 'view, play'}
+    return config
+
+
+@pytest.fixture
+def guard(bot):
+    guard = bot.get_plugin(Commands).guard
+    assert isinstance(guard, policy)
+    return guard
+
+
+def allowed(guard, mask, permission):
+    return guard.has_permission(IrcString(mask), permission)
+
+
+def test_cached(guard, monkeypatch):
+    assert allowed(guard, 'a!u@admin', 'admin')
+    assert allowed(guard, 'b!u@h', 'play')
+    assert not allowed(guard, 'b!u@h', 'admin')
+    assert set(guard.cache) == {'a', 'b'}
+    monkeypatch.setattr(guard, 'matchers', {})
+    # from the cache, not matched again
+    assert allowed(guard, 'a!u@admin', 'admin')
+    assert allowed(guard, 'b!u@h', 'play')
+
+
+def test_host_change_checked_again(guard):
+    assert allowed(guard, 'a!u@admin', 'admin')
+    # someone else taking the nick
+    assert not allowed(guard, 'a!u@elsewhere', 'admin')
+    assert guard.cache['a'][0] == 'a!u@elsewhere'
+
+
+def test_forgotten_on_nick_and_quit(bot, guard):
+    allowed(guard, 'a!u@admin', 'admin')
+    allowed(guard, 'b!u@h', 'view')
+    bot.feed(':a!u@admin NICK c', ':b!u@h QUIT :bye')
+    assert guard.cache == {}
+
+
+def test_commands_checked(bot):
+    bot.join('#a')
+    bot.feed(':x!u@h PRIVMSG #a :!join')
+    bot.feed(':x!u@h PRIVMSG #a :!kick x')
+    assert 'x' in bot.plugin.games['#a'].pending_players
+    bot.feed(':a!u@admin PRIVMSG #a :!kick x')
+    assert 'x' not in bot.plugin.games['#a'].pending_players
+
+
+def test_masks_changed_at_runtime(bot, guard):
+    assert not allowed(guard, 'b!u@h', 'admin')
+    # as irc3 stores them
+    bot.db = {guard: {'b!*@*': 'admin'}}
+    assert allowed(guard, 'b!u@h', 'admin')
+    assert not allowed(guard, 'c!u@h', 'admin')
+    bot.db[guard] = {'c!*@*': 'admin'}
+    assert allowed(guard, 'c!u@h', 'admin')
+
+
+def test_config_reloaded(bot, guard):
+    assert allowed(guard, 'b!u@h', 'play')
+    bot.config[policy.key] = {'*!*@admin': ALL}
+    assert not allowed(guard, 'b!u@h', 'play')
+
+
+def test_events_kept_across_reloads(bot, guard):
+    bot.reload('none')
+    assert bot.get_plugin(Commands).guard is guard
+    allowed(guard, 'a!u@admin', 'admin')
+    bot.feed(':a!u@admin QUIT :bye')
+    assert guard.cache == {}
@@ -0,0 +1,21 @@
+from cadavre.irc_colors import IRCColors as colors
+
+
+def test_strip_codes():
+    text = '\x02\x0303,04vert\x03 \x1fet\x0f \x16rouge'
+    assert colors.strip(text) == 'vert et rouge'
+
+
+def test_strip_plain_text_as_is():
+    text = "le pape confiant"
+    assert colors.strip(text) is text
+
+
+def test_strip_keeps_non_ascii_digits():
+    assert colors.strip('\x03٣٤x') == '٣٤x'
+    assert colors.strip('\x0303٣') == '٣'
+
+
+def test_tags():
+    assert colors.bold_green('x') == '\x02\x0303x\x02\x0399'
+    assert colors.bold_green is colors.BoldGreen
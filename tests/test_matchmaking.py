@@ -0,0 +1,66 @@
+from cadavre.bot import State
+
+
+def join(bot, *nicks, channel='#a'):
+    for nick in nicks:
+        bot.feed(f':{nick}!u@h PRIVMSG {channel} :!join')
+
+
+def seated(game):
+    return [sorted(table.players) for table in game.tables]
+
+
+def test_full_tables(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    nicks = [f'p{i:02}' for i in range(14)]
+    join(bot, *nicks)
+    assert [table.number for table in game.tables] == [1, 2]
+    assert sorted(sum(seated(game), [])) == nicks[:12]
+    assert sorted(game.idle_players()) == nicks[12:]
+    assert 'PRIVMSG #a :p13: je note pour la prochaine partie' in bot.sent
+
+
+def test_start_everyone(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    # a full table opens as soon as six are waiting, the rest on demand
+    join(bot, *'abcdefghijk')
+    assert seated(game) == [list('abcdef')]
+    bot.feed(':g!u@h PRIVMSG #a :!start')
+    assert sorted(map(len, seated(game))) == [5, 6]
+    assert not game.idle_players()
+    for table in game.tables:
+        assert table.state == State.game
+        for nick in table.players:
+            assert game.player_tables[nick] is table
+
+
+def test_not_enough_to_start(bot):
+    bot.join('#a')
+    join(bot, 'a', 'b')
+    bot.feed(':a!u@h PRIVMSG #a :!start')
+    assert bot.plugin.games['#a'].tables == []
+    assert bot.sent[-1] == 'PRIVMSG #a :nan, il manque des joueurs'
+
+
+def test_table_numbers_reused(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    join(bot, *(f'p{i:02}' for i in range(12)))
+    first, second = game.tables
+    game.close_table(first)
+    assert sorted(game.idle_players()) == sorted(first.players)
+    game.matchmake()
+    assert [table.number for table in game.tables] == [2, 1]
+    assert game.tables[0] is second
+
+
+def test_one_channel_at_a_time(bot):
+    bot.join('#a')
+    bot.join('#b')
+    join(bot, 'a')
+    join(bot, 'a', channel='#b')
+    assert bot.sent[-1] == 'PRIVMSG #b :a: tu joues déjà sur #a'
+    assert bot.plugin.player_game('a') is bot.plugin.games['#a']
+    assert 'a' not in bot.plugin.games['#b'].pending_players
@@ -0,0 +1,12 @@
+from cadavre.metrics import REGISTRY, HANDLER_SECONDS
+
+
+def test_commands_timed_whatever_the_guard(bot, monkeypatch):
+    # the fixture leaves irc3's own guard, letting everything through
+    monkeypatch.setattr(REGISTRY, 'enabled', True)
+    monkeypatch.setattr(REGISTRY, 'histograms', {})
+    bot.join('#a')
+    bot.feed(':x!u@h PRIVMSG #a :!top', ':x!u@h PRIVMSG #a :!top')
+    histogram = REGISTRY.histograms[
+        HANDLER_SECONDS, (('handler', 'Cadavre.top'),)]
+    assert histogram.count == 2
@@ -0,0 +1,136 @@
+import concurrent.futures
+
+from cadavre.output import Output, CRITICAL, NORMAL, COSMETIC
+
+
+class Handle:
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Loop:
+    """Runs nothing by itself, time only moves when told"""
+
+    def __init__(self):
+        self.now = 0.
+        self.handles = []
+
+    def time(self):
+        return self.now
+
+    def call_soon(self, callback):
+        handle = Handle(callback)
+        self.handles.append(handle)
+        return handle
+
+    def call_later(self, delay, callback):
+        return self.call_soon(callback)
+
+    def create_future(self):
+        return concurrent.futures.Future()
+
+
+class Bot:
+    def __init__(self, **config):
+        self.loop = Loop()
+        self.config = dict(dict(flood_burst=1, flood_rate=1), **config)
+        self.nick = 'bot'
+        self.sent = []
+
+    def send(self, line):
+        self.sent.append(line)
+
+
+def output(**config):
+    bot = Bot(**config)
+    return bot, Output(bot)
+
+
+def drain(bot, out):
+    """Send everything, one token at a time"""
+    while out.targets:
+        bot.loop.now += 1
+        out.pump()
+    return bot.sent
+
+
+def test_fifo_per_target():
+    bot, out = output()
+    out.tokens = 0
+    out.enqueue(COSMETIC, ('#a',), 'PRIVMSG #a :counter')
+    out.enqueue(CRITICAL, ('#a',), 'PRIVMSG #a :sentence')
+    out.enqueue(NORMAL, ('#b',), 'PRIVMSG #b :hello')
+    assert drain(bot, out) == [
+        'PRIVMSG #a :counter', 'PRIVMSG #a :sentence', 'PRIVMSG #b :hello']
+
+
+def test_priority_across_targets():
+    bot, out = output()
+    out.tokens = 0
+    out.enqueue(COSMETIC, ('#a',), 'PRIVMSG #a :counter')
+    out.enqueue(CRITICAL, ('toto',), 'PRIVMSG toto :prompt')
+    assert drain(bot, out) == ['PRIVMSG toto :prompt', 'PRIVMSG #a :counter']
+
+
+def test_aging():
+    bot, out = output()
+    out.tokens = 0
+    out.enqueue(COSMETIC, ('#a',), 'PRIVMSG #a :counter')
+    bot.loop.now += 2 * Output.AGING + 1
+    for i in range(3):
+        out.enqueue(CRITICAL, (f'p{i}',), f'PRIVMSG p{i} :prompt')
+    assert drain(bot, out)[0] == 'PRIVMSG #a :counter'
+
+
+def test_multi_target_line_keeps_order():
+    bot, out = output()
+    out.tokens = 0
+    out.enqueue(COSMETIC, ('a',), 'PRIVMSG a :first')
+    out.enqueue(CRITICAL, ('a', 'b'), 'PRIVMSG a,b :both')
+    out.enqueue(CRITICAL, ('b',), 'PRIVMSG b :last')
+    assert drain(bot, out) == [
+        'PRIVMSG a :first', 'PRIVMSG a,b :both', 'PRIVMSG b :last']
+    assert out.queued == [0, 0, 0]
+
+
+def test_send_line_shares_the_budget():
+    bot, out = output(flood_burst=2)
+    out.privmsg('#a', 'staged')
+    future = out.send_line('PRIVMSG #a :reply')
+    out.send_line('PONG :srv', nowait=True)
+    # the staged line went out before the reply, the PONG right away
+    assert bot.sent == ['PRIVMSG #a :staged', 'PRIVMSG #a :reply',
+                        'PONG :srv']
+    assert future.done()
+    assert out.tokens < 0
+    out.send_line('PRIVMSG #a :later')
+    assert bot.sent[-1] == 'PONG :srv'
+    assert drain(bot, out)[-1] == 'PRIVMSG #a :later'
+
+
+def test_packing():
+    bot, out = output(flood_burst=10, server_config=dict(
+        MODES=3, TARGMAX='PRIVMSG:2'))
+    out.mode('#a', '+v', 'a', 'b', 'c', 'd')
+    out.mode('#a', '-v', 'b')
+    for nick in ('x', 'y', 'z'):
+        out.privmsg(nick, 'salut')
+    out.flush()
+    assert bot.sent == ['PRIVMSG x,y :salut', 'PRIVMSG z :salut',
+                        'MODE #a +vvv a c d', 'MODE #a -v b']
+
+
+def test_repeats_kept():
+    bot, out = output(flood_burst=10, server_config=dict(
+        TARGMAX='PRIVMSG:2'))
+    out.privmsg('a', 'salut')
+    out.privmsg('b', 'salut')
+    out.privmsg('a', 'ça va ?')
+    out.privmsg('a', 'salut')
+    out.flush()
+    assert bot.sent == ['PRIVMSG a,b :salut', 'PRIVMSG a :ça va ?',
+                        'PRIVMSG a :salut']
@@ -0,0 +1,61 @@
+import pytest
+
+from cadavre.pacing import Pacing, HOUR
+
+
+def test_grace_shrinks_without_corrections():
+    pacing = Pacing(grace=4, min_grace=1)
+    assert pacing.grace_delay() == 4
+    delays = []
+    for _ in range(30):
+        pacing.ended(corrected=False, now=0)
+        delays.append(pacing.grace_delay())
+    assert delays == sorted(delays, reverse=True)
+    assert delays[0] == pytest.approx(3.4)
+    assert delays[-1] == pytest.approx(1, abs=.01)
+    # a correction brings some of it back
+    pacing.ended(corrected=True, now=0)
+    assert pacing.grace_delay() > delays[-1] + .5
+
+
+def test_cooldown_cut_when_ready():
+    pacing = Pacing(cooldown=6, min_cooldown=2)
+    sentence = 'x' * 100
+    assert pacing.cooldown_delay(sentence, ready=False) == 6
+    # time to read it, at 20 characters per second
+    assert pacing.cooldown_delay(sentence, ready=True) == 5
+    assert pacing.cooldown_delay('court', ready=True) == 2
+    assert pacing.cooldown_delay('x' * 1000, ready=True) == 6
+
+
+def test_pauses_accounted():
+    pacing = Pacing(grace=4, cooldown=6)
+    assert pacing.pause_per_game() is None
+    pacing.grace_delay()
+    pacing.cooldown_delay('', ready=False)
+    pacing.ended(corrected=False, now=0)
+    assert pacing.pause_per_game() == 10
+
+
+def test_games_per_hour():
+    pacing = Pacing()
+    for now in (0, 1000, 2000, HOUR + 1500):
+        pacing.ended(corrected=False, now=now)
+    assert pacing.games_per_hour(now=HOUR + 1500) == 2
+    assert pacing.games_per_hour(now=3 * HOUR) == 0
+    assert pacing.games == 4
+
+
+def test_fill_delay_follows_response_time():
+    pacing = Pacing()
+    # nothing known yet, the full timeout
+    assert pacing.fill_delay(180) == 180
+    pacing.answered(5)
+    assert pacing.fill_delay(180) == Pacing.MIN_FILL
+    for _ in range(50):
+        pacing.answered(30)
+    assert pacing.fill_delay(180) == pytest.approx(120, abs=1)
+    for _ in range(50):
+        pacing.answered(100)
+    assert pacing.fill_delay(180) == 180
+    assert pacing.fill_delay(10) == 10
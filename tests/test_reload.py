@@ -0,0 +1,69 @@
+from cadavre.bot import Cadavre
+
+NICKS = ['a', 'b', 'c', 'd', 'e', 'f']
+
+
+def reload(bot):
+    """Hand the plugin over to a new instance and route the events to it,
+    as bot.reload() does without reloading the module"""
+    old = bot.plugin
+    new = Cadavre.reload(old)
+    scanned = list(reversed(bot.registry.scanned))
+    bot.registry.reset()
+    bot.registry.plugins[f'{Cadavre.__module__}.{Cadavre.__name__}'] = new
+    for module, categories in scanned:
+        bot.include(module, venusian_categories=categories)
+    bot.registry.reloading = {}
+    return old, new
+
+
+def half_played(bot):
+    """A table of six on #a, half of them having answered"""
+    bot.join('#a')
+    bot.feed(':a!u@h PRIVMSG #a :!join 1h')
+    for nick in NICKS[1:]:
+        bot.feed(f':{nick}!u@h PRIVMSG #a :!join')
+    table, = bot.plugin.games['#a'].tables
+    for nick in table.players[:3]:
+        bot.feed(f':{nick}!u@h PRIVMSG bot :fragment de {nick}')
+    return table
+
+
+def finish(bot, table):
+    for nick in table.players[3:]:
+        bot.feed(f':{nick}!u@h PRIVMSG bot :fragment de {nick}')
+    bot.run(.05)
+    return [line for line in bot.sent if line.startswith('PRIVMSG #a :▷')]
+
+
+def test_adopt(bot):
+    table = half_played(bot)
+    old, new = reload(bot)
+    game = new.games['#a']
+    assert game is old.games['#a'] and game.plugin is new
+    assert game.tables == [table]
+    assert new.players is old.players and new.output is old.output
+    assert new.deadlines is old.deadlines and 'a' in new.deadlines
+    assert new.deadlines.callback == new.expire
+    assert len(finish(bot, table)) == 1
+
+
+def test_through_state(bot):
+    old_table = half_played(bot)
+    old = bot.plugin
+    old.state_version = 0
+    old, new = reload(bot)
+    game = new.games['#a']
+    assert game is not old.games['#a'] and game.plugin is new
+    table, = game.tables
+    assert table is not old_table and old.games['#a'].tables == []
+    assert table.pieces == old_table.pieces
+    assert table.pieces is not old_table.pieces
+    assert new.player_game('a') is game
+    assert new.output is old.output
+    assert all(game.has_voice(nick) for nick in NICKS)
+    # the play time moved to the new heap
+    assert 'a' in new.deadlines and len(old.deadlines) == 0
+    sentence, = finish(bot, table)
+    for nick in NICKS:
+        assert f'fragment de {nick}' in sentence.lower()
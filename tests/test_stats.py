@@ -0,0 +1,75 @@
+import json
+
+from cadavre.bot import Cadavre
+from cadavre.checkpoint import Checkpoint
+from cadavre.stats import Stats
+
+
+def counted():
+    stats = Stats()
+    stats.answered('Toto', 'S', 3.)
+    stats.answered('toto', 'V', 12.)
+    stats.played('Toto')
+    stats.aborted('toto')
+    stats.blamed('TOTO')
+    return stats
+
+
+def test_round_trip():
+    stats = counted()
+    # as it goes through the checkpoint
+    state = json.loads(json.dumps(stats.to_state()))
+    assert sorted(state) == ['piece:S', 'piece:V', 'player:toto']
+    restored = Stats()
+    for key, value in state.items():
+        restored.from_state(key, value)
+    toto = restored.get('toto')
+    assert toto.nick == 'TOTO'
+    assert (toto.games, toto.aborts, toto.blames) == (1, 1, 1)
+    assert toto.delays.quantile(.5) == stats.get('toto').delays.quantile(.5)
+    assert restored.pieces['S'].count == 1
+    assert restored.to_state() == stats.to_state()
+
+
+def test_changes_reported():
+    changed = []
+    stats = Stats(changed.append)
+    stats.answered('Toto', 'S', 3.)
+    stats.blamed('titi')
+    assert changed == ['player:toto', 'piece:S', 'player:titi']
+    del changed[:]
+    stats.merge(counted())
+    assert sorted(set(changed)) == ['piece:S', 'piece:V', 'player:toto']
+
+
+def test_kept_across_restarts(bot, tmp_path):
+    path = str(tmp_path / 'state.json')
+    plugin = bot.plugin
+    plugin.config['checkpoint_delay'] = 0
+    plugin.checkpoint = Checkpoint(path, bot.loop)
+    plugin.checkpoint.load()
+    plugin.player_stats.answered('toto', 'S', 3.)
+    plugin.player_stats.blamed('toto')
+    bot.run(.05)
+
+    restarted = Cadavre(bot)
+    restarted.checkpoint = Checkpoint(path, bot.loop)
+    restarted.from_state(restarted.checkpoint.load())
+    toto = restarted.player_stats.get('toto')
+    assert toto.blames == 1 and toto.delays.count == 1
+    assert restarted.player_stats.pieces['S'].count == 1
+
+
+def test_piece_stats(bot):
+    bot.join('#a')
+    bot.feed(':x!u@h PRIVMSG #a :!stats S')
+    assert bot.sent[-1] == 'PRIVMSG #a :pas encore de sujet'
+    for delay in range(1, 11):
+        bot.plugin.player_stats.answered('toto', 'S', delay)
+    bot.feed(':x!u@h PRIVMSG #a :!stats S')
+    assert bot.sent[-1].startswith('PRIVMSG #a :sujet: 10 réponses, en 5.')
+    # a player of that nick comes first
+    bot.plugin.player_stats.played('S')
+    bot.feed(':x!u@h PRIVMSG #a :!stats S')
+    assert bot.sent[-1] == (
+        'PRIVMSG #a :S: 1 parties, 0 abandons, relancé 0 fois')
@@ -0,0 +1,80 @@
+from cadavre.bot import State
+
+NICKS = list('abcdef')
+
+
+def join(bot, *nicks):
+    for nick in nicks:
+        bot.feed(f':{nick}!u@h PRIVMSG #a :!join')
+
+
+def answer(bot, *nicks):
+    for nick in nicks:
+        bot.feed(f':{nick}!u@h PRIVMSG bot :fragment de {nick}')
+
+
+def sentences(bot):
+    return [line for line in bot.sent if line.startswith('PRIVMSG #a :▷')]
+
+
+def table(bot, *nicks):
+    bot.join('#a')
+    join(bot, *nicks)
+    return bot.plugin.games['#a'].tables[0]
+
+
+def test_part_with_substitute(bot):
+    t = table(bot, *NICKS, 'g')
+    game = t.game
+    leaving = t.players[0]
+    piece = t.player_pieces[leaving]
+    bot.feed(f':{leaving}!u@h PART #a')
+    assert f"PRIVMSG #a :{leaving} s'est barré, g prend sa place" in bot.sent
+    assert t.players[0] == 'g' and t.player_pieces['g'] == piece
+    assert game.player_tables['g'] is t
+    assert leaving not in game.player_tables
+    assert bot.plugin.player_game(leaving) is None
+    assert any(line.startswith('PRIVMSG g :donne-moi') for line in bot.sent)
+    answer(bot, *t.players)
+    bot.run(.05)
+    sentence, = sentences(bot)
+    assert 'fragment de g' in sentence.lower()
+    assert not t.filled
+
+
+def test_part_without_substitute(bot):
+    t = table(bot, *NICKS)
+    leaving = t.players[0]
+    bot.feed(f':{leaving}!u@h PART #a')
+    assert (f"PRIVMSG #a :{leaving} s'est barré, je complète son fragment"
+            in bot.sent)
+    assert t.filled == {t.player_pieces[leaving]}
+    answer(bot, *t.players[1:])
+    bot.run(.05)
+    assert len(sentences(bot)) == 1
+
+
+def test_fill_timeout(bot):
+    # no next game in the meantime
+    bot.plugin.config.update(fill_timeout=.05, cooldown=10)
+    t = table(bot, *NICKS)
+    slow = t.players[-1]
+    answer(bot, *t.players[:-1])
+    assert t.state == State.game
+    bot.run(.1)
+    assert f'PRIVMSG #a :{slow}: trop tard, je complète' in bot.sent
+    assert t.filled == {t.player_pieces[slow]}
+    assert len(sentences(bot)) == 1
+
+
+def test_abort_completes(bot):
+    t = table(bot, *NICKS)
+    answer(bot, *t.players[:2])
+    bot.feed(':a!u@h PRIVMSG #a :!abort')
+    assert 'PRIVMSG #a :partie écourtée (noraj thizanne)' in bot.sent
+    assert t.filled == {t.player_pieces[nick] for nick in t.players[2:]}
+    assert len(t.pieces) == len(NICKS)
+    bot.run(.05)
+    sentence, = sentences(bot)
+    for nick in t.players[:2]:
+        assert f'fragment de {nick}' in sentence.lower()
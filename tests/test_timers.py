@@ -0,0 +1,134 @@
+import pytest
+
+from cadavre import timers
+from cadavre.timers import DeadlineHeap
+
+
+class Handle:
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Clock:
+    """Both the wall clock and the loop, time only moves when told"""
+
+    def __init__(self):
+        self.now = 1000.
+        self.handles = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        handle = Handle(when, callback)
+        self.handles.append(handle)
+        return handle
+
+    def armed(self):
+        return [handle for handle in self.handles if not handle.cancelled]
+
+    def advance(self, seconds):
+        """Move on, running the due timers"""
+        self.now += seconds
+        for handle in self.armed():
+            if handle.when <= self.now and not handle.cancelled:
+                handle.cancelled = True
+                handle.callback()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(timers, 'time', clock)
+    return clock
+
+
+def heap(clock):
+    fired = []
+    return fired, DeadlineHeap(clock, fired.append)
+
+
+def test_fire_in_order(clock):
+    fired, deadlines = heap(clock)
+    deadlines.schedule('b', clock.now + 20)
+    deadlines.schedule('a', clock.now + 10)
+    deadlines.schedule('c', clock.now + 20)
+    assert len(deadlines) == 3 and 'a' in deadlines
+    clock.advance(10)
+    assert fired == ['a']
+    clock.advance(10)
+    assert fired == ['a', 'b', 'c']
+    assert len(deadlines) == 0 and not clock.armed()
+
+
+def test_only_earliest_armed(clock):
+    fired, deadlines = heap(clock)
+    for i in range(5):
+        deadlines.schedule(i, clock.now + 10 + i)
+    armed, = clock.armed()
+    assert armed.when == clock.now + 10
+    deadlines.schedule('early', clock.now + 5)
+    armed, = clock.armed()
+    assert armed.when == clock.now + 5
+
+
+def test_reschedule_and_discard(clock):
+    fired, deadlines = heap(clock)
+    deadlines.schedule('a', clock.now + 10)
+    deadlines.schedule('b', clock.now + 10)
+    deadlines.schedule('a', clock.now + 30)
+    deadlines.discard('b')
+    deadlines.discard('unknown')
+    clock.advance(10)
+    assert fired == []
+    armed, = clock.armed()
+    assert armed.when == clock.now + 20
+    clock.advance(20)
+    assert fired == ['a']
+
+
+def test_past_deadline_fires_at_once(clock):
+    fired, deadlines = heap(clock)
+    deadlines.schedule('a', clock.now - 10)
+    clock.advance(0)
+    assert fired == ['a']
+
+
+def test_clear(clock):
+    fired, deadlines = heap(clock)
+    deadlines.schedule('a', clock.now + 10)
+    deadlines.clear()
+    assert not clock.armed()
+    clock.advance(10)
+    assert fired == [] and len(deadlines) == 0
+
+
+def test_cancelled_entries_compacted(clock):
+    fired, deadlines = heap(clock)
+    for i in range(1000):
+        deadlines.schedule(i, clock.now + 10 + i)
+        deadlines.discard(i)
+    assert len(deadlines.heap) <= 16
+    deadlines.schedule('a', clock.now + 5)
+    clock.advance(5)
+    assert fired == ['a']
+
+
+def test_callback_can_schedule(clock):
+    fired = []
+
+    def callback(key):
+        fired.append(key)
+        if key == 'a':
+            deadlines.schedule('b', clock.now + 10)
+
+    deadlines = DeadlineHeap(clock, callback)
+    deadlines.schedule('a', clock.now + 10)
+    clock.advance(10)
+    clock.advance(10)
+    assert fired == ['a', 'b']
@@ -0,0 +1,86 @@
+def modes(bot):
+    return [line for line in bot.sent if line.startswith('MODE')]
+
+
+def join(bot, *nicks):
+    for nick in nicks:
+        bot.feed(f':{nick}!u@h PRIVMSG #a :!join')
+
+
+def test_own_changes_acknowledged(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    join(bot, 'a')
+    assert modes(bot) == ['MODE #a +v a']
+    assert game.voicing == {'a': '+'} and game.has_voice('a')
+    bot.feed(':bot!b@h MODE #a +v a')
+    assert game.voiced == {'a'} and game.voicing == {}
+    bot.feed(':a!u@h PRIVMSG #a :!part')
+    assert modes(bot)[-1] == 'MODE #a -v a'
+    bot.feed(':bot!b@h MODE #a -v a')
+    assert game.voiced == set() and game.voicing == {}
+    assert not game.unsynced
+
+
+def test_voiced_on_join_are_queued(bot):
+    bot.join('#a', '+a', '@op', 'b')
+    game = bot.plugin.games['#a']
+    assert game.voiced == {'a'}
+    assert game.pending_players == {'a'}
+    # already voiced, nothing to send
+    join(bot, 'a')
+    assert modes(bot) == []
+
+
+def test_foreign_changes_checked_at_sync(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    join(bot, 'a')
+    bot.feed(':bot!b@h MODE #a +v a',
+             ':op!o@h MODE #a +ov-v op x a')
+    assert game.voiced == {'x'}
+    assert game.unsynced == {'x', 'a'}
+    game.sync_voices()
+    bot.run()
+    assert modes(bot)[1:] == ['MODE #a +v-v a x']
+    assert not game.unsynced
+
+
+def test_leave_and_rename(bot):
+    bot.join('#a', '+a', '+b', '+c')
+    game = bot.plugin.games['#a']
+    bot.feed(':a!u@h NICK a2')
+    assert game.voiced == {'a2', 'b', 'c'}
+    bot.feed(':a2!u@h PART #a', ':b!u@h QUIT :bye',
+             ':op!o@h KICK #a c :out')
+    assert game.voiced == set()
+    # rejoining doesn't bring the voice back
+    bot.feed(':b!u@h JOIN #a')
+    assert not game.has_voice('b')
+
+
+def test_refused(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    join(bot, 'a')
+    bot.feed(":srv 482 bot #a :You're not channel operator")
+    assert game.voicing == {} and not game.has_voice('a')
+    game.mode_nick('+v', 'a')
+    bot.run()
+    assert modes(bot) == ['MODE #a +v a', 'MODE #a +v a']
+
+
+def test_devoice_deferred_until_game_end(bot):
+    bot.join('#a')
+    game = bot.plugin.games['#a']
+    nicks = list('abcdef')
+    join(bot, *nicks)
+    bot.feed(f':bot!b@h MODE #a +vvvvvv {" ".join(nicks)}')
+    table, = game.tables
+    bot.feed(':a!u@h PRIVMSG #a :!part')
+    assert 'MODE #a -v a' not in modes(bot)
+    assert game.has_voice('a') and 'a' in game.unsynced
+    for nick in nicks:
+        bot.feed(f':{nick}!u@h PRIVMSG bot :fragment de {nick}')
+    bot.run(.05)
+    assert modes(bot)[-1] == 'MODE #a -v a'